@@ -0,0 +1,410 @@
+"""
+Offline tuning of AlertSpeed, OverSpeed, AlertSpeedTimer and HardCoupleSpeed.
+
+Loads TrainData recorded by R8Recorder (the RecordDir setting) into NumPy
+columns, re-runs R8Speeder's speeding, confirmation-window, overspeed,
+sustained-speeding and coupling rules as array passes, and reports how many
+alerts, bans and hard couples every combination in a grid of settings would
+have produced:
+
+    python R8Analyze.py recordings --alert 3,5,7 --over 15,20,25 --timer 180,300,600 --couple 5,7,9
+    python R8Analyze.py recordings --save session.npz
+    python R8Analyze.py --parity
+
+--parity drives R8Speeder's own handlers from the stand-in proxy, records
+the run and checks the analyzer gets the same alerts, train by train.
+Requires numpy (pip install numpy); R8Speeder itself does not.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import R8Recorder
+import R8Speeder as r8
+
+COLUMNS = ("time", "train", "speed", "limit", "block", "axles", "engineer_type", "symbol")
+KINDS = ("alerts", "overspeed_bans", "sustained_bans", "hard_couples")
+
+
+# =========================================================
+# LOADING
+# =========================================================
+def record_dtype():
+    """NumPy view of R8Recorder.RECORD."""
+    dtype = np.dtype([("time", "<f8"), ("train", "<i4"), ("speed", "<f4"), ("limit", "<f4"), ("block", "<i4"),
+                      ("axles", "<u2"), ("engineer_type", "u1"), ("pad", "u1"), ("symbol", "<u4"), ("name", "<u4")])
+    assert dtype.itemsize == R8Recorder.RECORD.size
+    return dtype
+
+
+def load_recordings(directory):
+    """(columns, symbols, player_type) for every segment in `directory`, symbols in one table."""
+    dtype = record_dtype()
+    parts, codes, player_type = [], {}, 0
+    for path in R8Recorder.segment_paths(directory):
+        with R8Recorder.Segment(path) as segment:
+            view = segment.buffer()
+            try:
+                rows = np.frombuffer(view, dtype=dtype).copy()
+            finally:
+                view.release()
+            player_type = segment.player_type
+            remap = np.array([codes.setdefault(s, len(codes)) for s in segment.strings], dtype=np.uint32)
+            # clock records carry DateTime ticks in the string index fields
+            clock = rows["train"] == R8Recorder.CLOCK_TRAIN_ID
+            rows["symbol"] = remap[np.where(clock, 0, rows["symbol"])]
+            parts.append(rows)
+    rows = np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+    return {name: rows[name] for name in COLUMNS}, list(codes), player_type
+
+
+def load_session(path):
+    """Columns from a recording directory or a session file written with --save."""
+    if os.path.isdir(path):
+        return load_recordings(path)
+    with np.load(path) as data:
+        return ({name: data[name] for name in COLUMNS}, json.loads(str(data["symbols"])),
+                int(data["player_type"]))
+
+
+def save_session(path, columns, symbols, player_type):
+    np.savez_compressed(path, symbols=np.array(json.dumps(symbols)), player_type=np.array(player_type), **columns)
+
+
+# =========================================================
+# RULE PASSES
+# =========================================================
+class Session:
+    """Player-train events in train order, plus everything the rule passes share.
+
+    A player session is a run of one train's player events that R8Speeder
+    would have tracked in a single TrainState; it ends when the engineer
+    relinquishes or the train goes quiet for PLAYER_TIMEOUT_SECONDS.
+    t_next is when the state after each event stops mattering: the train's
+    next event, its timeout, or the end of the recording. `ticks` holds every
+    sim time an event arrived at, which is when deadlines get to run.
+    """
+
+    def __init__(self, columns, symbols, player_type, rules):
+        timeout = r8.PLAYER_TIMEOUT_SECONDS
+        time_all = columns["time"]
+        self.ticks = np.unique(time_all)
+        self.end = self.ticks[-1] if len(self.ticks) else 0.0
+
+        events = columns["train"] != R8Recorder.CLOCK_TRAIN_ID
+        order = np.argsort(columns["train"][events], kind="stable")
+        col = {name: columns[name][events][order] for name in COLUMNS}
+        t, train = col["time"], col["train"]
+        player = col["engineer_type"] == player_type
+        n = len(t)
+
+        same_prev = np.zeros(n, bool)
+        same_prev[1:] = train[1:] == train[:-1]
+        continues = np.zeros(n, bool)
+        continues[1:] = same_prev[1:] & player[:-1] & (t[1:] - t[:-1] <= timeout)
+        t_after = np.full(n, self.end)
+        has_next = np.zeros(n, bool)
+        has_next[:-1] = same_prev[1:]
+        t_after[:-1] = np.where(has_next[:-1], t[1:], self.end)
+
+        keep = np.flatnonzero(player)
+        self.t = t[keep]
+        self.train = train[keep]
+        self.cur = np.abs(col["speed"][keep].astype(np.float64))
+        self.axles = col["axles"][keep].astype(np.int64)
+        self.start = ~continues[keep]
+        self.session = np.cumsum(self.start) - 1
+        self.t_next = np.minimum(t_after[keep], self.t + timeout)
+        self.eff, self.alert_override, self.over_override = self._apply_rules(
+            rules, symbols, col["symbol"][keep], col["block"][keep], col["limit"][keep].astype(np.float64))
+
+    def __len__(self):
+        return len(self.t)
+
+    def _apply_rules(self, rules, symbols, symbol, block, limit):
+        """Effective limit and per-rule AlertSpeed/OverSpeed overrides (NaN where none) for each event."""
+        combos = np.empty(len(symbol), dtype=[("symbol", "<u4"), ("block", "<i4"), ("limit", "<f8")])
+        combos["symbol"], combos["block"], combos["limit"] = symbol, block, limit
+        unique, inverse = np.unique(combos, return_inverse=True)
+        offset = np.full(len(unique), np.nan)
+        alert = np.full(len(unique), np.nan)
+        over = np.full(len(unique), np.nan)
+        for k, (sym, blk, lim) in enumerate(unique.tolist()):
+            mask = rules.candidates(symbols[sym], blk) if rules is not None else 0
+            rule = rules.select(mask, lim) if mask else None
+            if rule is not None:
+                offset[k] = rule.limit_offset
+                if rule.alert_speed is not None:
+                    alert[k] = rule.alert_speed
+                if rule.over_speed is not None:
+                    over[k] = rule.over_speed
+        inverse = inverse.reshape(-1)
+        eff = np.where(np.isnan(offset[inverse]), np.abs(limit), offset[inverse] + limit)
+        return eff, alert[inverse], over[inverse]
+
+    def _tick_after(self, times):
+        """First sim time strictly after each of `times` that a deadline could have fired at."""
+        idx = np.minimum(np.searchsorted(self.ticks, times, side="right"), len(self.ticks) - 1)
+        return self.ticks[idx]
+
+    def speeding(self, alert_speed):
+        """Speeding episodes for one AlertSpeed; the OverSpeed and AlertSpeedTimer sweeps build on the result.
+
+        Returns the TrainID of every SpeedingStartMsg, then per overspeed
+        window (the span between episode ends in which OvrSpeedBanMsg can fire
+        once) the peak margin over the effective limit and its TrainID, then
+        per episode the longest it stayed above the alert speed past the
+        confirmation (sustained fires for timers below it) and its TrainID.
+        """
+        n = len(self)
+        conf = r8.SPEED_CONFIRMATION_SECONDS
+        t, cur, eff, start, session = self.t, self.cur, self.eff, self.start, self.session
+        alert = np.where(np.isnan(self.alert_override), alert_speed, self.alert_override)
+        above = cur > eff + alert
+        stop = cur < eff + alert - 1.0
+
+        # Runs of consecutive above-alert events; the first one sets speed_exceed_start.
+        prev_above = np.zeros(n, bool)
+        prev_above[1:] = above[:-1] & ~start[1:]
+        next_above = np.zeros(n, bool)
+        next_above[:-1] = above[1:] & ~start[1:]
+        run_first = np.flatnonzero(above & ~prev_above)
+        run_last = np.flatnonzero(above & ~next_above)
+        run_id = np.cumsum(above & ~prev_above) - 1
+        s = t[run_first]
+
+        # Confirmed per event once 5 s have passed, or by the deadline at the first tick after s + 5
+        # if the run is still unbroken then (the deadline runs before the breaking event's handler).
+        confirmed = (self.t_next[run_last] > s + conf) | (t[run_last] - s >= conf)
+        above_rows = np.flatnonzero(above)
+        ok_rows = above_rows[t[above_rows] - s[run_id[above_rows]] >= conf]
+        first_ok = np.full(len(s), -1)
+        runs_ok, first = np.unique(run_id[ok_rows], return_index=True)
+        first_ok[runs_ok] = ok_rows[first]
+        has_ok = first_ok >= 0
+        exact = has_ok & (t[np.maximum(first_ok, 0)] == s + conf)
+        confirm_time = np.where(exact, s + conf, self._tick_after(s + conf))[confirmed]
+        confirm_row = np.where(has_ok, first_ok, run_last + 1)[confirmed]
+        confirm_session = session[run_first][confirmed]
+        confirm_train = self.train[run_first][confirmed]
+
+        # Confirmations and stops in event order; the confirmation comes before its event's handler.
+        stop_rows = np.flatnonzero(stop)
+        keys = np.concatenate((2 * confirm_row, 2 * stop_rows + 1))
+        is_confirm = np.concatenate((np.ones(len(confirm_row), bool), np.zeros(len(stop_rows), bool)))
+        marker_session = np.concatenate((confirm_session, session[stop_rows]))
+        marker_time = np.concatenate((confirm_time, np.zeros(len(stop_rows))))
+        marker_train = np.concatenate((confirm_train, self.train[stop_rows]))
+        order = np.argsort(keys, kind="stable")
+        keys, is_confirm = keys[order], is_confirm[order]
+        marker_session, marker_time, marker_train = marker_session[order], marker_time[order], marker_train[order]
+
+        m = len(keys)
+        after_confirm = np.zeros(m, bool)
+        after_confirm[1:] = is_confirm[:-1] & (marker_session[1:] == marker_session[:-1])
+        opens = is_confirm & ~after_confirm
+        closes = ~is_confirm & after_confirm
+        opener = np.maximum.accumulate(np.where(opens, np.arange(m), -1)) if m else np.zeros(0, int)
+
+        # State after each event: inside an episode when the last marker so far is a confirmation.
+        last_marker = np.searchsorted(keys, 2 * np.arange(n) + 1, side="right") - 1
+        has_marker = last_marker >= 0
+        last_marker = np.maximum(last_marker, 0)
+        in_episode = (has_marker & is_confirm[last_marker] & (marker_session[last_marker] == session)
+                      if m else np.zeros(n, bool))
+
+        # Sustained: above the alert speed inside the episode with the timer running out before the next event.
+        rows = np.flatnonzero(above & in_episode)
+        episode_of_row = opener[last_marker[rows]]
+        longest = np.full(m, -np.inf)
+        np.maximum.at(longest, episode_of_row, self.t_next[rows] - marker_time[episode_of_row])
+
+        # Overspeed: one ban per window between episode ends (and train state resets).
+        closes_at = np.zeros(n, bool)
+        closes_at[(keys[closes] - 1) // 2] = True
+        window_start = start.copy()
+        window_start[1:] |= closes_at[:-1]
+        window = np.cumsum(window_start) - 1
+        margin = cur - eff
+        margin = np.where(np.isnan(self.over_override), margin,
+                          np.where(margin > self.over_override, np.inf, -np.inf))
+        margin = np.where(above, margin, -np.inf)
+        peak = np.full(window[-1] + 1 if n else 0, -np.inf)
+        np.maximum.at(peak, window, margin)
+
+        return (marker_train[opens], peak, self.train[window_start], longest[opens], marker_train[opens])
+
+    def couplings(self):
+        """(previous speed, TrainID) for every CoupledMsg.
+
+        Axle changes are found with one array pass; only those events go
+        through the 5 s block that follows every change.
+        """
+        axles, start, t = self.axles, self.start, self.t
+        changed = np.zeros(len(self), bool)
+        changed[1:] = (axles[1:] != axles[:-1]) & ~start[1:]
+        blocked_until = {}
+        speeds, trains = [], []
+        for i in np.flatnonzero(changed).tolist():
+            session = self.session[i]
+            if axles[i] < axles[i - 1]:
+                blocked_until[session] = t[i] + r8.AXLE_BLOCK_DURATION_SECONDS
+                continue
+            until = blocked_until.get(session)
+            if until is not None and t[i] < until:
+                continue
+            blocked_until[session] = t[i] + r8.AXLE_BLOCK_DURATION_SECONDS
+            speeds.append(self.cur[i - 1])
+            trains.append(self.train[i])
+        return np.array(speeds, dtype=np.float64), np.array(trains, dtype=np.int64)
+
+
+def sweep(session, alerts, overs, timers, couples):
+    """Rows of (AlertSpeed, OverSpeed, AlertSpeedTimer, HardCoupleSpeed, alerts, overspeed, sustained, couples)."""
+    couple_speeds, _ = session.couplings()
+    hard = {c: int(np.count_nonzero(couple_speeds > c)) for c in couples}
+    rows = []
+    for a in alerts:
+        starts, peak, _, longest, _ = session.speeding(a)
+        peak_sorted = np.sort(peak)
+        longest_sorted = np.sort(longest)
+        for o, timer, c in itertools.product(overs, timers, couples):
+            bans = len(peak_sorted) - np.searchsorted(peak_sorted, o, side="right")
+            sustained = len(longest_sorted) - np.searchsorted(longest_sorted, timer, side="right")
+            rows.append((a, o, timer, c, len(starts), int(bans), int(sustained), hard[c]))
+    return rows
+
+
+def per_train(session, alert, over, timer, couple):
+    """Counter of (kind, TrainID) for one setting, the shape --parity compares."""
+    counts = Counter()
+    starts, peak, window_train, longest, episode_train = session.speeding(alert)
+    counts.update(("alerts", int(tid)) for tid in starts)
+    counts.update(("overspeed_bans", int(tid)) for tid in window_train[peak > over])
+    counts.update(("sustained_bans", int(tid)) for tid in episode_train[longest > timer])
+    speeds, trains = session.couplings()
+    counts.update(("hard_couples", int(tid)) for tid in trains[speeds > couple])
+    return counts
+
+
+# =========================================================
+# PARITY
+# =========================================================
+def scalar_run(directory, players, ai, steps, seed):
+    """Run R8Speeder's handlers over the stand-in fleet while recording; Counter of (kind, TrainID) alerts."""
+    import R8StandIn
+    r8.load_settings()
+    r8.discord_enabled = False
+    r8.EEngineerType = R8StandIn.EEngineerType
+    proxy = R8StandIn.StandInRun8Proxy(R8StandIn.Fleet(R8StandIn.FleetSpec(players=players, ai=ai, seed=seed)))
+    server = r8.servers[0]
+    counts = Counter()
+    format_msg = r8.format_msg
+
+    def counting_format_msg(key, **kwargs):
+        if key == "SpeedingStartMsg":
+            counts["alerts", kwargs["train_id"]] += 1
+        elif key == "OvrSpeedBanMsg":
+            counts["overspeed_bans", kwargs["train_id"]] += 1
+        elif key == "SustSpeedBanMsg":
+            counts["sustained_bans", kwargs["train_id"]] += 1
+        elif key == "CoupledMsg" and kwargs["speed"] > server.hard_couple_speed:
+            counts["hard_couples", kwargs["train"].TrainID] += 1
+        return format_msg(key, **kwargs)
+
+    r8.format_msg = counting_format_msg
+    r8.attach(server, proxy)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        r8.record_dir = directory
+        r8.start_recorder()
+        for _ in range(steps):
+            proxy.step()
+        server.recorder.close()
+    r8.format_msg = format_msg
+    return counts, server
+
+
+def parity(args):
+    with tempfile.TemporaryDirectory() as directory:
+        expected, server = scalar_run(directory, args.players, args.ai, args.steps, args.seed)
+        columns, symbols, player_type = load_recordings(directory)
+    session = Session(columns, symbols, player_type, server.speed_rules)
+    got = per_train(session, server.alert_speed, server.over_speed, server.alert_speed_timer, server.hard_couple_speed)
+    print(f"=== R8Analyze parity: {args.players} players, {args.ai} AI, {args.steps} steps ===")
+    for kind in KINDS:
+        scalar = sum(v for (k, _), v in expected.items() if k == kind)
+        vector = sum(v for (k, _), v in got.items() if k == kind)
+        print(f"{kind:<16} handlers={scalar:<6} analyzer={vector:<6} {'ok' if scalar == vector else 'MISMATCH'}")
+    diffs = sorted(set(expected) | set(got))
+    diffs = [key for key in diffs if expected[key] != got[key]]
+    for kind, tid in diffs[:20]:
+        print(f"  {kind} train {tid}: handlers={expected[kind, tid]} analyzer={got[kind, tid]}")
+    print("parity ok" if not diffs else f"parity FAILED for {len(diffs)} train/alert pairs")
+    return 0 if not diffs else 1
+
+
+# =========================================================
+# MAIN
+# =========================================================
+def floats(text):
+    return [float(v) for v in text.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep R8Speeder thresholds over a recorded session.")
+    parser.add_argument("session", nargs="?", help="RecordDir folder, or a .npz written with --save")
+    parser.add_argument("--alert", type=floats, help="AlertSpeed values, comma separated (default: settings)")
+    parser.add_argument("--over", type=floats, help="OverSpeed values")
+    parser.add_argument("--timer", type=floats, help="AlertSpeedTimer values, seconds")
+    parser.add_argument("--couple", type=floats, help="HardCoupleSpeed values")
+    parser.add_argument("--save", default=None, help="write the loaded columns to this .npz session file")
+    parser.add_argument("--settings", default=None, help="settings file for SpeedRules and defaults")
+    parser.add_argument("--server", default=None, help="use this Servers entry's thresholds (default: the first)")
+    parser.add_argument("--parity", action="store_true", help="check the analyzer against R8Speeder's handlers")
+    parser.add_argument("--players", type=int, default=60)
+    parser.add_argument("--ai", type=int, default=40)
+    parser.add_argument("--steps", type=int, default=1800)
+    parser.add_argument("--seed", type=int, default=8)
+    args = parser.parse_args()
+
+    if np is None:
+        print("numpy is required for the analyzer. Install with: pip install numpy")
+        sys.exit(1)
+    if args.settings:
+        r8.SETTINGS_FILE = args.settings
+    if args.parity:
+        sys.exit(parity(args))
+    if not args.session:
+        parser.error("a session folder or file is required unless --parity is given")
+
+    r8.load_settings()
+    server = next((s for s in r8.servers if s.name == args.server), None) if args.server else r8.servers[0]
+    if server is None:
+        parser.error(f"no server named {args.server!r} in the settings")
+    columns, symbols, player_type = load_session(args.session)
+    if args.save:
+        save_session(args.save, columns, symbols, player_type)
+    session = Session(columns, symbols, player_type, server.speed_rules)
+    rows = sweep(session, args.alert or [server.alert_speed], args.over or [server.over_speed],
+                 args.timer or [server.alert_speed_timer], args.couple or [server.hard_couple_speed])
+
+    print(f"{len(session)} player events, {len(np.unique(session.train))} trains, "
+          f"{int(session.session[-1]) + 1 if len(session) else 0} player sessions")
+    print(f"{'Alert':>6} {'Over':>6} {'Timer':>6} {'Couple':>6} | "
+          f"{'alerts':>7} {'overspd':>7} {'sustain':>7} {'hardcpl':>7}")
+    for a, o, timer, c, alerts, bans, sustained, hard in rows:
+        print(f"{a:>6g} {o:>6g} {timer:>6g} {c:>6g} | {alerts:>7} {bans:>7} {sustained:>7} {hard:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Load-replay benchmark for the R8Speeder TrainData path.
+
+Drives R8Speeder's handlers from the R8StandIn proxy and reports events/sec,
+p50/p99 per-call latency and memory growth for on_train_data, handle_speeding,
+handle_coupling and monitor_tick. Runs anywhere Python does, no Run8 needed.
+
+    python R8Bench.py --players 60 --ai 120 --seconds 600
+
+--servers N monitors N stand-in servers (each with its own fleet) from the
+one process, the way a Servers list in the settings does. --profile N adds
+R8Speeder's per-phase breakdown of 1 in N events (see R8Profile.py).
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import R8Speeder as r8
+import R8StandIn
+
+
+class Timings:
+    """Collects per-call durations in nanoseconds for one function."""
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+        self.enabled = True
+
+    def wrap(self, fn):
+        samples = self.samples
+        clock = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            t0 = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                samples.append(clock() - t0)
+
+        return timed
+
+    def percentile(self, pct):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[idx] / 1000.0
+
+    def report(self, wall_seconds):
+        count = len(self.samples)
+        rate = count / wall_seconds if wall_seconds > 0 else 0.0
+        return (f"{self.name:<20} calls={count:<9} rate={rate:>11.0f}/s "
+                f"p50={self.percentile(50):>8.1f}us p99={self.percentile(99):>8.1f}us")
+
+
+def setup(args):
+    """Load settings and wire each R8Speeder server to a fresh stand-in proxy."""
+    if args.settings:
+        r8.SETTINGS_FILE = args.settings
+    if args.servers > 1 or args.metrics:
+        with open(r8.SETTINGS_FILE) as f:
+            data = json.load(f)
+        if args.servers > 1:
+            data["Servers"] = [{"Name": f"server{i + 1}"} for i in range(args.servers)]
+        if args.metrics:
+            # Metrics are set up as the servers are built, so they have to be on in the settings.
+            data["MetricsSummaryTimer"] = 1
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(data, f)
+        r8.SETTINGS_FILE = f.name
+        r8.load_settings()
+        os.remove(r8.SETTINGS_FILE)
+    else:
+        r8.load_settings()
+    r8.discord_enabled = False
+    r8.EEngineerType = R8StandIn.EEngineerType
+
+    proxies = []
+    for i, server in enumerate(r8.servers):
+        spec = R8StandIn.FleetSpec(players=args.players, ai=args.ai, seed=args.seed + i)
+        proxy = R8StandIn.StandInRun8Proxy(R8StandIn.Fleet(spec), step_seconds=args.step)
+        r8.attach(server, proxy)
+        proxies.append(proxy)
+    r8.start_pipeline()
+    if args.record:
+        r8.record_dir = args.record
+        r8.start_recorder()
+    if args.history:
+        r8.history_file = args.history
+        r8.start_history()
+    if args.metrics:
+        r8.start_metrics()
+    if args.profile:
+        r8.profile_sample_every = args.profile
+        if args.profile_file:
+            r8.profile_file = args.profile_file
+        r8.start_profiler()
+    if args.discord:
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        client = R8StandIn.FakeDiscordClient(fail_every=50)
+        r8.discord_enabled = True
+        for server in r8.servers:
+            server.discord_status_channel, server.discord_alert_channel = 1, 2
+        r8.discord_loop, r8.discord_client = loop, client
+        r8.discord_dispatcher = r8.DiscordDispatcher(client, loop)
+    return proxies
+
+
+def run(args):
+    names = ("on_train_data", "process_train_update", "handle_speeding", "handle_coupling", "monitor_tick")
+    timings = {name: Timings(name) for name in names}
+    for name in ("on_train_data", "process_train_update", "handle_speeding", "handle_coupling"):
+        setattr(r8, name, timings[name].wrap(getattr(r8, name)))
+    monitor_tick = timings["monitor_tick"].wrap(r8.monitor_tick)
+    proxies = setup(args)
+
+    def step():
+        for proxy in proxies:
+            proxy.step()
+
+    steps = int(args.seconds / args.step)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(args.warmup):
+            step()
+        r8.flush_pipeline()
+        for t in timings.values():
+            t.samples.clear()
+
+        wall0 = time.perf_counter()
+        for _ in range(steps):
+            step()
+            monitor_tick()
+            if not args.burst:
+                r8.flush_pipeline()
+        r8.flush_pipeline()
+        wall = time.perf_counter() - wall0
+        stats = r8.pipeline_stats()
+
+        for t in timings.values():
+            t.enabled = False
+        tracemalloc.start()
+        mem0, _ = tracemalloc.get_traced_memory()
+        for _ in range(steps):
+            step()
+            monitor_tick()
+            if not args.burst:
+                r8.flush_pipeline()
+        r8.flush_pipeline()
+        mem1, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    events = len(timings["on_train_data"].samples)
+    print(f"=== R8Bench: {args.servers} x ({args.players} players, {args.ai} AI), {steps} steps of {args.step}s ===")
+    print(f"TrainData events: {events} in {wall:.2f}s wall ({events / wall:.0f} events/s)")
+    for t in timings.values():
+        print(t.report(wall))
+    print(f"memory growth over {steps} more steps: {(mem1 - mem0) / 1024:.1f} KiB (peak {peak / 1024:.1f} KiB)")
+    print(f"pipeline: {stats}")
+    print(f"unchanged updates skipped: {stats['unchanged']} of {stats['updates']} "
+          f"({100.0 * stats['unchanged'] / max(1, stats['updates']):.1f}%)")
+    if args.discord:
+        time.sleep(0.5)
+        print(f"discord: {r8.discord_dispatcher.stats()} channel lookups={r8.discord_client.lookups}")
+    for server, proxy in zip(r8.servers, proxies):
+        trains = server.trains
+        print(f"--- {server.name} ---")
+        record_size = sys.getsizeof(next(iter(trains.values()), None))
+        print(f"tracked trains: {len(trains)} ({record_size} bytes per state record)")
+        print(f"train store: {trains.stats()}, pending deadlines: {len(server.deadlines)}")
+        if args.discord:
+            print(f"alert storms: {server.alert_storms.stats()}")
+        server.radio_sender.flush()
+        print(f"radio: {server.radio_sender.stats()}, SendRadioText calls: {len(proxy.radio_log)}")
+        if server.recorder is not None:
+            server.recorder.close()
+            print(f"recorder: {server.recorder.stats()}")
+    if r8.history is not None:
+        print(f"history: {r8.history.stats()}")
+    if r8.metrics is not None:
+        print(r8.metrics_summary())
+    if r8.profiler is not None:
+        print(r8.profiler.report())
+        if args.profile_file:
+            r8.write_profile()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark R8Speeder against the stand-in Run8 proxy.")
+    parser.add_argument("--players", type=int, default=60)
+    parser.add_argument("--ai", type=int, default=120)
+    parser.add_argument("--seconds", type=float, default=600.0, help="sim seconds per measured pass")
+    parser.add_argument("--step", type=float, default=1.0, help="sim seconds between TrainData rounds")
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=8)
+    parser.add_argument("--burst", action="store_true",
+                        help="don't wait for the worker between rounds; exercises coalescing and backpressure")
+    parser.add_argument("--discord", action="store_true", help="route Discord output through a fake local client")
+    parser.add_argument("--record", default=None, help="also record the TrainData stream to this directory")
+    parser.add_argument("--history", default=None, help="also write the violation history to this SQLite file")
+    parser.add_argument("--settings", default=None, help="settings file (default SpeederSettings.json)")
+    parser.add_argument("--metrics", action="store_true", help="run with metrics instrumentation on")
+    parser.add_argument("--servers", type=int, default=1, help="number of stand-in servers to monitor at once")
+    parser.add_argument("--profile", type=int, default=0, metavar="N", help="profile 1 in N TrainData events")
+    parser.add_argument("--profile-file", default=None,
+                        help="also write the profile to PROFILE_FILE.folded and PROFILE_FILE.txt")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
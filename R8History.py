@@ -0,0 +1,243 @@
+"""
+Violation history for R8Speeder, kept in a local SQLite database.
+
+Every speeding start/end, overspeed and sustained-speeding ban, coupling,
+control change and timeout the bot reports is also stored here (the
+HistoryFile setting), so staff can look up a player's record without
+scrolling Discord:
+
+    python R8History.py speeder.db top --days 7
+    python R8History.py speeder.db couples --block 32045 --min-speed 7
+    python R8History.py speeder.db engineer "Some Player"
+"""
+import argparse
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    sim_time TEXT,
+    kind TEXT NOT NULL,
+    engineer TEXT,
+    symbol TEXT,
+    train_id INTEGER,
+    block INTEGER,
+    speed REAL,
+    limit_mph REAL,
+    amount REAL,
+    peak REAL,
+    server TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_events_engineer ON events (engineer, ts);
+CREATE INDEX IF NOT EXISTS ix_events_symbol ON events (symbol, ts);
+CREATE INDEX IF NOT EXISTS ix_events_block ON events (block, kind, ts);
+CREATE INDEX IF NOT EXISTS ix_events_kind ON events (kind, ts, engineer);
+"""
+INSERT = ("INSERT INTO events (ts, sim_time, kind, engineer, symbol, train_id, block, speed, limit_mph, amount, peak, "
+          "server) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+# What `amount` and `peak` hold for each kind of event
+KINDS = {
+    "speeding_start": ("", ""),
+    "speeding_end": ("duration minutes", "max MPH over limit"),
+    "overspeed_ban": ("MPH over limit", ""),
+    "sustained_ban": ("minutes speeding", ""),
+    "coupled": ("coupling speed MPH", ""),
+    "hard_coupled": ("coupling speed MPH", ""),
+    "took_control": ("", ""),
+    "relinquished": ("", ""),
+    "timeout": ("", ""),
+}
+# Couplings at or below HardCoupleSpeed are logged as "coupled" and are not violations. Older databases
+# have every coupling as "coupled", so none of theirs count.
+VIOLATIONS = ("speeding_start", "overspeed_ban", "sustained_ban", "hard_coupled")
+COUPLINGS = ("coupled", "hard_coupled")
+HISTORY_BUFFER_SIZE = 50000
+HISTORY_FLUSH_SECONDS = 1.0
+
+
+def connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    # Databases written before R8Speeder could monitor several servers have no server column.
+    if "server" not in {row[1] for row in conn.execute("PRAGMA table_info(events)")}:
+        conn.execute("ALTER TABLE events ADD COLUMN server TEXT")
+    return conn
+
+
+# =========================================================
+# WRITER
+# =========================================================
+class HistoryStore:
+    """Write-behind queue in front of the events table.
+
+    add() appends to a bounded deque and returns; a writer thread inserts
+    whatever has built up in one transaction every HISTORY_FLUSH_SECONDS.
+    When the queue is full, events are dropped and counted rather than
+    holding up the detectors.
+    """
+
+    def __init__(self, path, capacity=HISTORY_BUFFER_SIZE):
+        self.path = path
+        self.capacity = capacity
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._buffer = deque()
+        self._wake = threading.Event()
+        self._conn = connect(path)
+
+    def add(self, kind, sim_time, snap, train_id, amount=None, peak=None, server=None):
+        """Queue one event; `snap` is the TrainSnapshot it was raised for (or None), `server` the server name
+        when several are monitored."""
+        if len(self._buffer) >= self.capacity:
+            self.dropped += 1
+            return
+        self._buffer.append((time.time(), sim_time, kind, snap, train_id, amount, peak, server))
+
+    def run(self):
+        while True:
+            self._wake.wait(HISTORY_FLUSH_SECONDS)
+            self._wake.clear()
+            self._drain()
+
+    def _drain(self):
+        rows, flushed = [], []
+        while self._buffer:
+            item = self._buffer.popleft()
+            if isinstance(item, threading.Event):
+                flushed.append(item)
+                continue
+            ts, sim_time, kind, snap, train_id, amount, peak, server = item
+            sim_time = str(sim_time) if sim_time is not None else None
+            if snap is None:
+                rows.append((ts, sim_time, kind, None, None, train_id, None, None, None, amount, peak, server))
+            else:
+                rows.append((ts, sim_time, kind, snap.EngineerName, snap.TrainSymbol, train_id, snap.BlockID,
+                             snap.TrainSpeedMph, snap.TrainSpeedLimitMPH, amount, peak, server))
+        if rows:
+            try:
+                with self._conn:
+                    self._conn.executemany(INSERT, rows)
+                self.written += len(rows)
+                self.batches += 1
+            except sqlite3.Error as ex:
+                self.dropped += len(rows)
+                print(f"[History] Write to {self.path} failed: {ex!r}")
+        for event in flushed:
+            event.set()
+
+    def flush(self, timeout=None):
+        """Block until everything added so far is committed, or for at most `timeout` seconds; True if it was."""
+        done = threading.Event()
+        self._buffer.append(done)
+        self._wake.set()
+        return done.wait(timeout)
+
+    def stats(self):
+        return {"buffered": len(self._buffer), "written": self.written, "batches": self.batches,
+                "dropped": self.dropped}
+
+
+# =========================================================
+# QUERIES
+# =========================================================
+def top_offenders(conn, since, limit=10):
+    """Engineers by number of violations since `since` (epoch seconds)."""
+    marks = ",".join("?" * len(VIOLATIONS))
+    return conn.execute(
+        f"SELECT engineer, COUNT(*) AS total, "
+        f"SUM(kind = 'speeding_start'), SUM(kind = 'overspeed_ban'), SUM(kind = 'sustained_ban'), "
+        f"SUM(kind = 'hard_coupled') FROM events INDEXED BY ix_events_kind WHERE kind IN ({marks}) AND ts >= ? "
+        f"GROUP BY engineer ORDER BY total DESC LIMIT ?", (*VIOLATIONS, since, limit)).fetchall()
+
+
+def couples(conn, since, block=None, min_speed=0.0, limit=100):
+    """Couplings, hard or not, at or above `min_speed`, newest first, optionally in one block."""
+    if block is None:
+        sql = ("SELECT * FROM events WHERE kind IN (?, ?) AND ts >= ? AND amount >= ? "
+               "ORDER BY ts DESC LIMIT ?")
+        args = (*COUPLINGS, since, min_speed, limit)
+    else:
+        sql = ("SELECT * FROM events WHERE block = ? AND kind IN (?, ?) AND ts >= ? AND amount >= ? "
+               "ORDER BY ts DESC LIMIT ?")
+        args = (block, *COUPLINGS, since, min_speed, limit)
+    return conn.execute(sql, args).fetchall()
+
+
+def events_for(conn, column, value, since, limit=100):
+    """Every event for one engineer, symbol or block, newest first."""
+    assert column in ("engineer", "symbol", "block")
+    return conn.execute(f"SELECT * FROM events WHERE {column} = ? AND ts >= ? ORDER BY ts DESC LIMIT ?",
+                        (value, since, limit)).fetchall()
+
+
+def format_event(row):
+    _, ts, sim_time, kind, engineer, symbol, train_id, block, speed, limit, amount, peak, server = row
+    text = f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(ts))} [{sim_time}] {kind:<14} {engineer or '-'}, " \
+           f"{symbol or '-'} ({train_id}) block {block if block is not None else '-'}"
+    if speed is not None:
+        text += f" {speed:.1f}/{limit:.1f} MPH"
+    labels = KINDS.get(kind, ("", ""))
+    if amount is not None and labels[0]:
+        text += f", {labels[0]} {amount:.1f}"
+    if peak is not None and labels[1]:
+        text += f", {labels[1]} {peak:.1f}"
+    if server:
+        text += f" ({server})"
+    return text
+
+
+# =========================================================
+# MAIN
+# =========================================================
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--days", type=float, default=7.0, help="how far back to look (default 7)")
+    common.add_argument("--limit", type=int, default=50)
+    parser = argparse.ArgumentParser(description="Query the R8Speeder violation history.")
+    parser.add_argument("database")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("top", parents=[common], help="engineers with the most violations")
+    p = sub.add_parser("couples", parents=[common], help="couplings, newest first")
+    p.add_argument("--block", type=int, default=None)
+    p.add_argument("--min-speed", type=float, default=0.0)
+    p = sub.add_parser("engineer", parents=[common], help="all events for an engineer")
+    p.add_argument("name")
+    p = sub.add_parser("symbol", parents=[common], help="all events for a train symbol")
+    p.add_argument("symbol")
+    p = sub.add_parser("block", parents=[common], help="all events in a block")
+    p.add_argument("block", type=int)
+    args = parser.parse_args()
+
+    conn = connect(args.database)
+    since = time.time() - args.days * 86400
+    t0 = time.perf_counter()
+    if args.command == "top":
+        rows = top_offenders(conn, since, args.limit)
+        print(f"{'Engineer':<24} {'total':>6} {'speed':>6} {'ovrspd':>6} {'sustain':>7} {'hardcpl':>7}")
+        for engineer, total, speeding, over, sustained, hard in rows:
+            print(f"{engineer or '-':<24} {total:>6} {speeding:>6} {over:>6} {sustained:>7} {hard:>7}")
+    else:
+        if args.command == "couples":
+            rows = couples(conn, since, args.block, args.min_speed, args.limit)
+        elif args.command == "engineer":
+            rows = events_for(conn, "engineer", args.name, since, args.limit)
+        elif args.command == "symbol":
+            rows = events_for(conn, "symbol", args.symbol, since, args.limit)
+        else:
+            rows = events_for(conn, "block", args.block, since, args.limit)
+        for row in rows:
+            print(format_event(row))
+    print(f"({len(rows)} rows in {(time.perf_counter() - t0) * 1000:.1f} ms)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
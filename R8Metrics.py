@@ -0,0 +1,221 @@
+"""
+Low-overhead metrics for R8Speeder: per-call latency histograms, lock wait
+and hold times, per-train event rates and gauges, served in the Prometheus
+text format from a small local HTTP endpoint (the MetricsPort setting):
+
+    curl http://127.0.0.1:9108/metrics
+
+Timing a call costs two perf_counter_ns reads and a bisect into fixed
+buckets, so it can stay on in production. Updates take no locks; when
+several threads hit the same histogram an increment can very occasionally be
+lost, which is fine for monitoring.
+"""
+import bisect
+import http.server
+import threading
+import time
+
+# Histogram bucket upper bounds in nanoseconds, 1 us to 1 s
+BUCKETS_NS = (1_000, 2_000, 5_000, 10_000, 20_000, 50_000, 100_000, 200_000, 500_000,
+              1_000_000, 2_000_000, 5_000_000, 10_000_000, 100_000_000, 1_000_000_000)
+RATE_WINDOW_SECONDS = 10.0
+TOP_TRAINS = 10
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# =========================================================
+# HISTOGRAMS
+# =========================================================
+class Histogram:
+    """Counts of durations (ns) per BUCKETS_NS bucket, plus their sum."""
+    __slots__ = ("counts", "sum_ns")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_NS) + 1)
+        self.sum_ns = 0
+
+    def observe(self, ns):
+        self.counts[bisect.bisect_left(BUCKETS_NS, ns)] += 1
+        self.sum_ns += ns
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def percentile(self, q):
+        """Estimated q-quantile in seconds (linear within the bucket), or None when empty."""
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                low = BUCKETS_NS[i - 1] if i else 0
+                high = BUCKETS_NS[i] if i < len(BUCKETS_NS) else BUCKETS_NS[-1] * 10
+                return (low + (high - low) * (rank - seen) / n) / 1e9
+            seen += n
+        return BUCKETS_NS[-1] / 1e9
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, n in zip(BUCKETS_NS, self.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels}le="{bound / 1e9:g}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels.rstrip(',')}}} {self.sum_ns / 1e9:.9f}")
+        lines.append(f"{name}_count{{{labels.rstrip(',')}}} {cumulative}")
+        return lines
+
+
+class TimedLock:
+    """A threading.Lock that records how long callers waited for it and how long they held it."""
+
+    def __init__(self, wait, hold):
+        self._lock = threading.Lock()
+        self._wait = wait
+        self._hold = hold
+        self._acquired = 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        t0 = time.perf_counter_ns()
+        got = self._lock.acquire(blocking, timeout)
+        if got:
+            self._acquired = now = time.perf_counter_ns()
+            self._wait.observe(now - t0)
+        return got
+
+    def release(self):
+        self._hold.observe(time.perf_counter_ns() - self._acquired)
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class EventRates:
+    """TrainData events per train, turned into per-second rates once every RATE_WINDOW_SECONDS."""
+
+    def __init__(self):
+        self._counts = {}
+        self._window_start = time.monotonic()
+        self.rates = {}
+
+    def add(self, key):
+        counts = self._counts
+        counts[key] = counts.get(key, 0) + 1
+
+    def roll(self):
+        """Close the current window if it is old enough; returns the last complete window's rates
+        (the current window's, until the first one closes)."""
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= RATE_WINDOW_SECONDS:
+            counts, self._counts = self._counts, {}
+            self._window_start = now
+            self.rates = {key: n / elapsed for key, n in counts.items()}
+        elif not self.rates and elapsed > 0:
+            return {key: n / elapsed for key, n in self._counts.items()}
+        return self.rates
+
+
+# =========================================================
+# REGISTRY
+# =========================================================
+class Metrics:
+    """Histograms per instrumented call and per lock, event rates, and the /metrics endpoint."""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock_wait = {}
+        self.lock_hold = {}
+        self.events = EventRates()
+        self._server = None
+
+    def timed(self, name, fn):
+        """Wrap `fn` so every call is recorded in the `name` histogram."""
+        histogram = self.calls.setdefault(name, Histogram())
+        observe = histogram.observe
+        clock = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            t0 = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(clock() - t0)
+
+        timed.__name__ = getattr(fn, "__name__", name)
+        timed.__wrapped__ = fn
+        return timed
+
+    def timed_lock(self, label):
+        return TimedLock(self.lock_wait.setdefault(label, Histogram()), self.lock_hold.setdefault(label, Histogram()))
+
+    def render(self, gauges):
+        """Prometheus text for the histograms plus `gauges`: (name, help, type, [(labels dict, value)])."""
+        lines = ["# HELP r8speeder_call_seconds Time spent in instrumented R8Speeder calls.",
+                 "# TYPE r8speeder_call_seconds histogram"]
+        for name, histogram in sorted(self.calls.items()):
+            lines += histogram.render("r8speeder_call_seconds", f'call="{name}",')
+        for family, help_text, histograms in (
+                ("r8speeder_lock_wait_seconds", "Time spent waiting for a server's lock.", self.lock_wait),
+                ("r8speeder_lock_hold_seconds", "Time a server's lock was held.", self.lock_hold)):
+            lines += [f"# HELP {family} {help_text}", f"# TYPE {family} histogram"]
+            for label, histogram in sorted(histograms.items()):
+                lines += histogram.render(family, f'server="{escape(label)}",')
+        for name, help_text, kind, samples in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                text = ",".join(f'{key}="{escape(str(val))}"' for key, val in labels.items())
+                lines.append(f"{name}{{{text}}} {value:g}" if text else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, gauges, host="127.0.0.1"):
+        """Serve render(gauges()) at http://host:port/metrics from a daemon thread."""
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics.render(gauges()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def micros(seconds):
+    """Format a duration in seconds for the console summary."""
+    if seconds is None:
+        return "-"
+    return f"{seconds * 1e6:.0f}us" if seconds < 0.001 else f"{seconds * 1e3:.1f}ms"
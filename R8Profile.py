@@ -0,0 +1,225 @@
+"""
+Sampling profiler for the R8Speeder TrainData path.
+
+With ProfileSampleEvery (or `python R8Speeder.py --profile N`) set, one
+TrainData event in N is followed from the DispatcherComms callback through
+the ingest queue and the detectors, and the time spent in each phase is
+recorded:
+
+    marshal      reading the Train properties over pythonnet (TrainSnapshot)
+    record       writing the raw event to the recorder, if RecordDir is set
+    queue        waiting in the ingest queue for the detection worker
+    process      lock wait, deadlines and state bookkeeping
+    transition   a player taking or giving up control
+    zero_limit   the 0 MPH limit check
+    speeding     the speeding detector
+    coupling     the coupling detector
+    output       formatting messages and handing them to the console, Discord,
+                 radio and history queues (nested under the phase that sent them)
+
+On exit the aggregated stacks are written in the folded format flame graph
+tools read (`flamegraph.pl R8Speeder-profile.folded > profile.svg`, or load
+it into speedscope), along with a text report of per-phase totals and the
+sampled events that took longest to handle (not counting time queued).
+Events that are not sampled pay one counter increment and the phase shims a
+thread-local lookup per call; on sampled events each phase boundary adds
+well under a microsecond, which shows in the smallest phases.
+"""
+import heapq
+import threading
+import time
+
+ROOT_FRAME = "TrainData"
+TOP_EVENTS = 20
+PHASES = ("marshal", "record", "queue", "process", "transition", "zero_limit", "speeding", "coupling", "output")
+QUEUE_PATH = f"{ROOT_FRAME};queue"
+
+
+# =========================================================
+# SAMPLES
+# =========================================================
+class Sample:
+    """Timeline of one sampled event as a stack of named frames.
+
+    The time between any two enter/exit calls is charged to the stack as it
+    stood, so every nanosecond from start to finish lands in exactly one
+    folded stack as self time.
+    """
+    __slots__ = ("server", "train_id", "sim_time", "start", "_mark", "_stack", "times", "unchanged")
+
+    def __init__(self, server, sim_time):
+        self.server = server
+        self.train_id = None
+        self.sim_time = sim_time
+        self.start = self._mark = time.perf_counter_ns()
+        self._stack = [ROOT_FRAME, PHASES[0]]
+        self.times = {}
+        self.unchanged = False
+
+    def _charge(self):
+        now = time.perf_counter_ns()
+        path = ";".join(self._stack)
+        self.times[path] = self.times.get(path, 0) + now - self._mark
+        self._mark = now
+
+    def enter(self, frame):
+        self._charge()
+        self._stack.append(frame)
+
+    def exit(self):
+        self._charge()
+        self._stack.pop()
+
+    def switch(self, frame):
+        """Leave the current top-level phase for `frame`."""
+        self._charge()
+        del self._stack[1:]
+        self._stack.append(frame)
+
+    def in_frame(self, frame):
+        return frame in self._stack
+
+    def finish(self):
+        self._charge()
+        return self._mark - self.start
+
+
+class _Local(threading.local):
+    sample = None
+
+
+# =========================================================
+# PROFILER
+# =========================================================
+class Profiler:
+    """Picks the sampled events, times phases on the current thread's sample and aggregates the results."""
+
+    def __init__(self, every, top=TOP_EVENTS):
+        self.every = max(1, int(every))
+        self.top = top
+        self.seen = 0
+        self.sampled = 0
+        self.finished = 0
+        self.stacks = {}
+        self.wall_ns = 0
+        self._slowest = []
+        self._lock = threading.Lock()
+        self._local = _Local()
+
+    def start(self, server, sim_time):
+        """A new Sample, in its marshal phase, for every `every`-th event, else None.
+
+        Callbacks racing on the counter may skip or repeat a sample, which is harmless.
+        """
+        self.seen += 1
+        if self.seen % self.every:
+            return None
+        self.sampled += 1
+        return Sample(server, sim_time)
+
+    def bind(self, sample):
+        """Make `sample` the one the phase shims on this thread record into (None to stop)."""
+        self._local.sample = sample
+
+    def phase(self, frame, fn, output=False):
+        """Wrap `fn` so calls made while a sample is bound are timed as `frame`.
+
+        Output calls are grouped under an "output" frame; output made from
+        within another output call is left to the outer one.
+        """
+        local = self._local
+
+        def profiled(*args, **kwargs):
+            sample = local.sample
+            if sample is None or (output and sample.in_frame("output")):
+                return fn(*args, **kwargs)
+            if output:
+                sample.enter("output")
+            sample.enter(frame)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                sample.exit()
+                if output:
+                    sample.exit()
+
+        profiled.__name__ = getattr(fn, "__name__", frame)
+        profiled.__wrapped__ = fn
+        return profiled
+
+    def finish(self, sample):
+        """Fold a completed sample into the totals and the slowest-events list."""
+        total = sample.finish()
+        handling = total - sample.times.get(QUEUE_PATH, 0)
+        with self._lock:
+            self.finished += 1
+            self.wall_ns += total
+            stacks = self.stacks
+            for path, ns in sample.times.items():
+                stacks[path] = stacks.get(path, 0) + ns
+            entry = (handling, self.finished, sample)
+            if len(self._slowest) < self.top:
+                heapq.heappush(self._slowest, entry)
+            elif handling > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    # -----------------------------------------------------
+    # Reports
+    # -----------------------------------------------------
+    def phase_totals(self):
+        """Inclusive nanoseconds per phase (and per output call as "output:<call>") over every sample."""
+        totals = {}
+        for path, ns in self.stacks.items():
+            frames = path.split(";")[1:]
+            for i, frame in enumerate(frames):
+                key = frame
+                if i and frames[i - 1] == "output":
+                    key = f"output:{frame}"
+                elif frame in frames[:i]:
+                    continue
+                totals[key] = totals.get(key, 0) + ns
+        return totals
+
+    def folded(self):
+        """Aggregated stacks in the folded format, one "frame;frame;frame microseconds" line each."""
+        lines = []
+        for path, ns in sorted(self.stacks.items()):
+            micros = round(ns / 1000)
+            if micros:
+                lines.append(f"{path} {micros}")
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        lines = [f"Sampled {self.finished} of {self.seen} TrainData events (1 in {self.every})"]
+        if not self.finished:
+            return "\n".join(lines)
+        totals = self.phase_totals()
+        lines.append(f"{'phase':<26} {'total ms':>10} {'per event us':>13} {'share':>7}")
+        ordered = [phase for phase in PHASES if phase in totals]
+        ordered += sorted((key for key in totals if key not in PHASES), key=lambda key: -totals[key])
+        for phase in ordered:
+            ns = totals[phase]
+            name = "  " + phase if phase.startswith("output:") else phase
+            lines.append(f"{name:<26} {ns / 1e6:>10.2f} {ns / 1e3 / self.finished:>13.1f} "
+                         f"{100.0 * ns / max(1, self.wall_ns):>6.1f}%")
+        lines.append("")
+        lines.append(f"Slowest {len(self._slowest)} sampled events (time to handle, then time queued):")
+        for handling, _, sample in sorted(self._slowest, key=lambda entry: -entry[0]):
+            parts = sorted(((path, ns) for path, ns in sample.times.items() if path != QUEUE_PATH),
+                           key=lambda item: -item[1])[:4]
+            breakdown = ", ".join(f"{path.split(';', 1)[-1]} {ns / 1e3:.1f}us" for path, ns in parts)
+            note = " unchanged" if sample.unchanged else ""
+            lines.append(f"{handling / 1e3:>8.1f}us {sample.times.get(QUEUE_PATH, 0) / 1e3:>8.0f}us  "
+                         f"{sample.server} train {sample.train_id} [{sample.sim_time}]{note}: {breakdown}")
+        return "\n".join(lines)
+
+    def write(self, path):
+        """Write `path`.folded and `path`.txt; returns their names."""
+        with self._lock:
+            folded, report = self.folded(), self.report()
+        names = (path + ".folded", path + ".txt")
+        with open(names[0], "w", encoding="utf-8") as f:
+            f.write(folded)
+        with open(names[1], "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+        return names
@@ -0,0 +1,224 @@
+"""
+Binary recorder for the raw TrainData stream R8Speeder receives.
+
+Every TrainData event becomes one fixed-width record appended to a
+preallocated, memory-mapped segment file, so an alert can be traced back to
+the exact sequence of speeds, limits and axle counts that produced it.
+Symbols and engineer names go into a per-segment string table, which keeps
+records fixed size. Segments rotate by size and are read back without
+copying:
+
+    python R8Recorder.py recordings --train 1042
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+
+MAGIC = b"R8REC001"
+# magic, record size, EEngineerType.Player value, record count
+HEADER = struct.Struct("<8sIIQ")
+COUNT_OFFSET = 16
+COUNT = struct.Struct("<Q")
+# sim seconds, TrainID, speed, limit, block, axles, engineer type, pad, symbol index, name index
+RECORD = struct.Struct("<diffiHBxII")
+RECORD_FIELDS = ("sim_seconds", "train_id", "speed", "limit", "block", "axles", "engineer_type", "symbol", "name")
+# Sim clock updates are stored as records with this TrainID; symbol/name carry the DateTime ticks (high/low words).
+CLOCK_TRAIN_ID = -1
+SEGMENT_SUFFIX = ".r8rec"
+STRINGS_SUFFIX = ".str"
+
+
+# =========================================================
+# WRITER
+# =========================================================
+class Recorder:
+    """Appends TrainData records to segment files in `directory`.
+
+    record() and clock() pack straight into the mapped segment with a
+    precompiled struct, so the only per-event work is the pack and two
+    dictionary lookups for the string table. Non-player trains, which the bot
+    only reads the ID and engineer type of, are recorded with those alone.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, player_type=0):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.player_type = player_type
+        self.segment_bytes = max(segment_bytes, HEADER.size + RECORD.size)
+        self.records = 0
+        self.segments = 0
+        self._lock = threading.Lock()
+        self._pack = RECORD.pack_into
+        self._pack_count = COUNT.pack_into
+        self._index = max((segment_index(name) for name in os.listdir(directory)
+                           if name.endswith(SEGMENT_SUFFIX)), default=-1)
+        self._file = None
+        self._mm = None
+        self._strings_file = None
+        self._open_segment()
+
+    def _open_segment(self):
+        self._index += 1
+        self.segments += 1
+        self.path = os.path.join(self.directory, f"segment-{self._index:06d}{SEGMENT_SUFFIX}")
+        self._file = open(self.path, "w+b")
+        self._file.truncate(self.segment_bytes)
+        self._mm = mmap.mmap(self._file.fileno(), self.segment_bytes)
+        HEADER.pack_into(self._mm, 0, MAGIC, RECORD.size, self.player_type, 0)
+        self._offset = HEADER.size
+        self._count = 0
+        self._strings = {"": 0}
+        self._strings_file = open(self.path + STRINGS_SUFFIX, "w", encoding="utf-8")
+        self._strings_file.write(json.dumps("") + "\n")
+
+    def _close_segment(self):
+        self._mm.flush()
+        self._mm.close()
+        self._file.truncate(self._offset)
+        self._file.close()
+        self._strings_file.close()
+
+    def _intern(self, text):
+        index = self._strings[text] = len(self._strings)
+        self._strings_file.write(json.dumps(text) + "\n")
+        self._strings_file.flush()
+        return index
+
+    def record(self, sim_seconds, train_id, engineer_type, snap):
+        """Append one TrainData event; `snap` is the TrainSnapshot, or None for non-player trains."""
+        with self._lock:
+            if self._offset + RECORD.size > self.segment_bytes:
+                self._close_segment()
+                self._open_segment()
+            if snap is None:
+                self._pack(self._mm, self._offset, sim_seconds, train_id, 0.0, 0.0, 0, 0, engineer_type, 0, 0)
+            else:
+                strings = self._strings
+                symbol = strings.get(snap.TrainSymbol)
+                if symbol is None:
+                    symbol = self._intern(snap.TrainSymbol)
+                name = strings.get(snap.EngineerName)
+                if name is None:
+                    name = self._intern(snap.EngineerName)
+                self._pack(self._mm, self._offset, sim_seconds, train_id, snap.TrainSpeedMph,
+                           snap.TrainSpeedLimitMPH, snap.BlockID, snap.AxleCount, engineer_type, symbol, name)
+            self._offset += RECORD.size
+            self._count += 1
+            self.records += 1
+            self._pack_count(self._mm, COUNT_OFFSET, self._count)
+
+    def clock(self, sim_seconds, ticks):
+        """Append a sim clock update, keeping the DateTime ticks so display times can be rebuilt."""
+        with self._lock:
+            if self._offset + RECORD.size > self.segment_bytes:
+                self._close_segment()
+                self._open_segment()
+            self._pack(self._mm, self._offset, sim_seconds, CLOCK_TRAIN_ID, 0.0, 0.0, 0, 0, 0,
+                       (ticks >> 32) & 0xFFFFFFFF, ticks & 0xFFFFFFFF)
+            self._offset += RECORD.size
+            self._count += 1
+            self._pack_count(self._mm, COUNT_OFFSET, self._count)
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._close_segment()
+                self._mm = None
+
+    def stats(self):
+        return {"records": self.records, "segments": self.segments, "path": self.path}
+
+
+# =========================================================
+# READER
+# =========================================================
+def segment_index(name):
+    stem = name[:-len(SEGMENT_SUFFIX)]
+    try:
+        return int(stem.rsplit("-", 1)[-1])
+    except ValueError:
+        return -1
+
+
+class Segment:
+    """One recorded segment, mapped read-only. Use as a context manager."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + STRINGS_SUFFIX, encoding="utf-8") as f:
+            self.strings = [json.loads(line) for line in f]
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, record_size, self.player_type, count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"{path} is not an R8Recorder segment")
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def buffer(self):
+        """memoryview of the record area; release() it before closing the segment."""
+        return memoryview(self._mm)[HEADER.size:HEADER.size + self.count * RECORD.size]
+
+    def records(self):
+        """Raw record tuples (see RECORD_FIELDS), unpacked straight from the mapping."""
+        view = self.buffer()
+        try:
+            yield from RECORD.iter_unpack(view)
+        finally:
+            view.release()
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def segment_paths(directory):
+    names = sorted((name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX)), key=segment_index)
+    return [os.path.join(directory, name) for name in names]
+
+
+def iter_records(directory, with_clock=False):
+    """(record tuple, segment) for every recorded event, oldest first."""
+    for path in segment_paths(directory):
+        with Segment(path) as segment:
+            for rec in segment.records():
+                if rec[1] != CLOCK_TRAIN_ID or with_clock:
+                    yield rec, segment
+
+
+# =========================================================
+# MAIN
+# =========================================================
+def main():
+    parser = argparse.ArgumentParser(description="Print TrainData recorded by R8Speeder.")
+    parser.add_argument("directory")
+    parser.add_argument("--train", type=int, default=None, help="only this TrainID")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many records")
+    args = parser.parse_args()
+
+    shown = 0
+    for rec, segment in iter_records(args.directory):
+        sim_seconds, train_id, speed, limit, block, axles, engineer_type, symbol, name = rec
+        if args.train is not None and train_id != args.train:
+            continue
+        print(f"{sim_seconds:10.1f} {train_id:>7} type={engineer_type} {speed:5.1f}/{limit:5.1f} MPH "
+              f"block {block:<6} axles {axles:<4} {segment.strings[symbol]} {segment.strings[name]}")
+        shown += 1
+        if args.limit and shown >= args.limit:
+            break
+
+
+if __name__ == "__main__":
+    main()
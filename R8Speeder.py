@@ -1,109 +1,250 @@
 import os
 import sys
 import json
+import argparse
 import threading
 import time
 import asyncio
-from typing import Dict, Set
+import bisect
+import heapq
+import queue
+import string
+from operator import attrgetter
+from collections import OrderedDict, deque
 
-try:
-    import clr
-except ImportError:
-    print("pythonnet is required. Install with: pip install pythonnet==3.0.3")
-    sys.exit(1)
+import R8Stats
 
 # ============ GLOBALS ============
 SETTINGS_FILE = "SpeederSettings.json"
-lock_obj = threading.Lock()
-
-# Data stores
-active_players: Dict[int, object] = {}
-speeding_start: Dict[int, object] = {}
-max_overspeed: Dict[int, float] = {}
-overspeed_warned: Set[int] = set()
-sustained_warned: Set[int] = set()
-last_axle_count: Dict[int, int] = {}
-last_speed: Dict[int, float] = {}
-axle_increase_blocked_until: Dict[int, object] = {}
-last_engineer_type: Dict[int, int] = {}
-last_player_name: Dict[int, str] = {}
-last_train_symbol: Dict[int, str] = {}
-speed_exceed_start: Dict[int, object] = {}
-prev_speed_snapshot: Dict[int, float] = {}
-zero_limit_pending: Dict[int, float] = {}
-zero_limit_announced: Set[int] = set()
-
-# State variables
-last_sim_time = None
-is_connected = False
-has_permission = False
-last_data_received_ts = None
-data_timeout_announced = False
+
+# Monitored Run8 servers, one Server each (see SERVERS below). Each has its own proxy,
+# sim clock, thresholds, tracked trains and detection worker.
+servers = []
+
+# Shared by every server: each server's detection worker -> output_stage -> Discord, log_sink
+output_stage = None
+log_sink = None
+history = None
+metrics = None
+profiler = None
+startup = None
 
 # Settings variables
-alert_speed = over_speed = alert_speed_timer = hard_couple_speed = 0
-trona_alert_speed = trona_route_id = superc_alert_speed = 0
-superc_train_symbols = ""
 dispatcher_comms_path = ""
 discord_enabled = False
 discord_token = ""
-discord_alert_channel = 0
-discord_status_channel = 0
-periodic_announce_time = 0
+verbose_logging = False
+stats_digest_time = 3600
+alert_storm_trains = 4
+alert_storm_window = 60.0
+alert_ping_interval = 60.0
+train_state_cap = 5000
+train_state_ttl = 900.0
+log_file = ""
+log_max_bytes = 10 * 1024 * 1024
+log_rotate_seconds = 24 * 3600
+log_backups = 5
+log_json = False
+record_dir = ""
+record_segment_mb = 64
+history_file = ""
+metrics_port = 0
+metrics_summary_time = 0
+profile_sample_every = 0
+profile_file = "R8Speeder-profile"
 messages = {}
+templates = {}
+snapshot_optional_fields = ("RailroadInitials", "LocoNumber")
 
 # .NET and Discord objects
-mRun8 = None
 DispatcherProxyFactory = None
 Run8ProxyFactory = None
 EEngineerType = None
 discord_client = None
 discord_loop = None
-startup_complete_announced = False
+discord_dispatcher = None
 
+TICKS_PER_SECOND = 10_000_000
 SPEED_CONFIRMATION_SECONDS = 5.0
+ZERO_LIMIT_CONFIRMATION_SECONDS = 3.0
 AXLE_BLOCK_DURATION_SECONDS = 5
+PLAYER_TIMEOUT_SECONDS = 5.0
+INGEST_QUEUE_SIZE = 10000
+DEADLINE_POLL_SECONDS = 0.25
 DISPATCHER_RADIO_CHANNEL = 0
+RADIO_MIN_INTERVAL_SECONDS = 1.0
+RADIO_DEDUPE_SECONDS = 60.0
+RADIO_MERGE_SECONDS = 2.0
+DISCORD_RATE_MESSAGES = 5
+DISCORD_RATE_SECONDS = 5.0
+DISCORD_MAX_CHARS = 2000
+DISCORD_MAX_RETRIES = 3
+DISCORD_EARLY_BUFFER = 500
+LOG_BUFFER_SIZE = 10000
+LOG_FLUSH_SECONDS = 0.5
+EXIT_FLUSH_SECONDS = 5.0
+# Calls timed when metrics are on; each is looked up as a module global at call time, so wrapping it here
+# instruments every caller.
+METRICS_CALLS = ("on_train_data", "process_train_update", "handle_speeding", "handle_coupling", "format_msg",
+                 "discord_send", "send_radio_text", "monitor_tick")
+# Phases the profiler times by wrapping the module global that runs them, as for METRICS_CALLS.
+PROFILE_PHASES = {"handle_control_change": "transition", "send_zero_speed_limit_radio_if_needed": "zero_limit",
+                  "handle_speeding": "speeding", "handle_coupling": "coupling"}
+PROFILE_OUTPUT_CALLS = ("format_msg", "emit", "discord_send", "radio_notice", "radio_zero_limit", "log_history")
+PROFILE_DEFAULT_EVERY = 100
 
 
 # =========================================================
 # SETTINGS
 # =========================================================
 def load_settings():
-    global alert_speed, over_speed, alert_speed_timer, hard_couple_speed, verbose_logging
-    global trona_alert_speed, trona_route_id, superc_alert_speed, superc_train_symbols
-    global dispatcher_comms_path, discord_enabled, discord_token, discord_alert_role
-    global discord_alert_channel, discord_status_channel, messages, periodic_announce_time
+    global verbose_logging, dispatcher_comms_path, discord_enabled, discord_token, messages, servers
+    global train_state_cap, train_state_ttl, templates, snapshot_optional_fields
+    global log_file, log_max_bytes, log_rotate_seconds, log_backups, log_json, record_dir, record_segment_mb
+    global history_file, stats_digest_time, metrics_port, metrics_summary_time, profile_sample_every, profile_file
+    global metrics
 
     with open(SETTINGS_FILE, "r") as f:
         data = json.load(f)
 
-    alert_speed = float(data["AlertSpeed"])
-    over_speed = float(data["OverSpeed"])
-    alert_speed_timer = int(data["AlertSpeedTimer"])
-    hard_couple_speed = float(data["HardCoupleSpeed"])
     verbose_logging = float(data["VerboseLogging"])
-    trona_alert_speed = float(data["TronaAlertSpeed"])
-    trona_route_id = int(data["TronaRouteID"])
-    superc_alert_speed = float(data["SuperCAlertSpeed"])
-    superc_train_symbols = data["SuperCTrainSymbols"]
     dispatcher_comms_path = data["DispatcherCommsPath"]
-    periodic_announce_time = data["PeriodicAnnounceTimer"]
+    train_state_cap = int(data.get("TrainStateCap", train_state_cap))
+    train_state_ttl = float(data.get("TrainStateTTL", train_state_ttl))
+    log_file = os.path.expandvars(data.get("LogFile", log_file))
+    log_max_bytes = int(float(data.get("LogMaxMB", log_max_bytes / (1024 * 1024))) * 1024 * 1024)
+    log_rotate_seconds = float(data.get("LogRotateHours", log_rotate_seconds / 3600)) * 3600
+    log_backups = int(data.get("LogBackups", log_backups))
+    log_json = bool(data.get("LogJson", log_json))
+    record_dir = data.get("RecordDir", record_dir)
+    record_segment_mb = float(data.get("RecordSegmentMB", record_segment_mb))
+    history_file = data.get("HistoryFile", history_file)
+    stats_digest_time = int(data.get("StatsDigestTimer", stats_digest_time))
+    metrics_port = int(data.get("MetricsPort", metrics_port))
+    metrics_summary_time = int(data.get("MetricsSummaryTimer", metrics_summary_time))
+    profile_sample_every = int(data.get("ProfileSampleEvery", profile_sample_every))
+    profile_file = os.path.expandvars(data.get("ProfileFile", profile_file))
 
     discord_enabled = bool(data["DiscordEnabled"])
     discord_token = data["DiscordBotToken"]
-    discord_alert_channel = int(data["DiscordAlertChannel"])
-    discord_status_channel = int(data["DiscordStatusChannel"])
-    discord_alert_role = int(data["DiscordAlertRole"])
 
     messages = data["Messages"]  # full dictionary of message templates
+    templates, errors = compile_messages(messages)
+    used = set().union(*(t.train_fields for t in templates.values()))
+    snapshot_optional_fields = tuple(name for name in TrainSnapshot.OPTIONAL_FIELDS if name in used)
+
+    # Top-level thresholds, rules and channels are the defaults for every Servers entry.
+    # Each Server builds its lock from `metrics`, so it exists before any worker can take the lock.
+    metrics = None
+    if metrics_port or metrics_summary_time:
+        import R8Metrics
+        metrics = R8Metrics.Metrics()
+    servers = [Server({**data, **entry}) for entry in data.get("Servers") or [{}]]
+    names = [server.name for server in servers]
+    errors += [f"Servers: {name!r} is listed more than once" for name in sorted(set(names)) if names.count(name) > 1]
+    if errors:
+        for error in errors:
+            print(f"[Speeder] SpeederSettings.json: {error}")
+        sys.exit(1)
+    if len(servers) > 1:
+        for server in servers:
+            server.prefix = f"[{server.name}] "
+
+
+# =========================================================
+# SERVERS
+# =========================================================
+class Server:
+    """One monitored Run8 server: its proxy, sim clock, thresholds and tracked trains.
+
+    `settings` is the top-level settings with this server's Servers entry laid
+    over them, so thresholds, SpeedRules and Discord channels can differ per
+    server. Each server's TrainData is handled on its own detection worker
+    under its own lock; every handler takes the Server as its first argument.
+    """
+
+    def __init__(self, settings):
+        self.host = settings.get("Host", "localhost")
+        self.port = int(settings["Port"]) if "Port" in settings else None
+        self.name = str(settings.get("Name") or self.host)
+        self.prefix = ""
+        self.lock = metrics.timed_lock(self.name) if metrics is not None else threading.Lock()
+
+        self.alert_speed = float(settings["AlertSpeed"])
+        self.over_speed = float(settings["OverSpeed"])
+        self.alert_speed_timer = int(settings["AlertSpeedTimer"])
+        self.hard_couple_speed = float(settings["HardCoupleSpeed"])
+        self.speed_rules = compile_speed_rules(settings)
+        self.periodic_announce_time = settings["PeriodicAnnounceTimer"]
+        self.discord_alert_channel = int(settings["DiscordAlertChannel"])
+        self.discord_status_channel = int(settings["DiscordStatusChannel"])
+        self.discord_alert_role = int(settings["DiscordAlertRole"])
+
+        # Per-train state, one TrainState per TrainID (see TRAIN STATE below)
+        self.trains = TrainStore(train_state_cap, train_state_ttl)
+        self.deadlines = DeadlineScheduler(self)
+        self.speed_stats = R8Stats.SpeedStats()
+        self.alert_storms = AlertCorrelator(
+            self, int(settings.get("AlertStormTrains", alert_storm_trains)),
+            float(settings.get("AlertStormWindow", alert_storm_window)),
+            float(settings.get("AlertPingInterval", alert_ping_interval)))
+
+        # Pipeline: DispatcherComms callback -> ingest_queue -> detection worker -> output_stage
+        self.proxy = None
+        self.ingest_queue = None
+        self.radio_sender = None
+        self.recorder = None
+
+        # State variables
+        self.last_sim_time = None
+        self.last_sim_seconds = None
+        self.last_sim_ticks = 0
+        self.is_connected = False
+        self.has_permission = False
+        self.last_data_received_ts = None
+        self.data_timeout_announced = False
+        self.startup_complete_announced = False
+        # TrainData that arrived before the first SimulationState, replayed once the sim clock is known
+        self.early_updates = deque(maxlen=INGEST_QUEUE_SIZE)
+        self.early_replayed = 0
+        self.updates_processed = 0
+        self.updates_unchanged = 0
+        # Latest sim seconds the detection worker has acted on; see process_train_update
+        self.last_processed_now = 0.0
+
+    def msg(self, key, **kwargs):
+        """format_msg(), prefixed with the server name when more than one server is monitored."""
+        text = format_msg(key, **kwargs)
+        return self.prefix + text if text and self.prefix else text
+
+    def emit(self, msg):
+        emit(msg, self.last_sim_time)
+
+
+def attach(server, proxy):
+    """Subscribe the handlers to a Run8 proxy for `server`."""
+    server.proxy = proxy
+    proxy.Connected += lambda sender, args: on_connected(server, sender, args)
+    proxy.Disconnected += lambda sender, args: on_disconnected(server, sender, args)
+    proxy.TrainData += lambda sender, e: on_train_data(server, sender, e)
+    proxy.SimulationState += lambda sender, args: on_simulation_state(server, sender, args)
+    try:
+        proxy.DispatcherPermission += lambda sender, args: on_dispatcher_permission(server, sender, args)
+    except Exception:
+        pass
 
 
 # =========================================================
 # DLL LOADING
 # =========================================================
 def load_dispatcher_comms():
+    """Start the CLR and load DispatcherComms. Imported here, not at the top, since pythonnet is slow to load."""
     global DispatcherProxyFactory, Run8ProxyFactory, EEngineerType
+    try:
+        import clr
+    except ImportError:
+        print("pythonnet is required. Install with: pip install pythonnet==3.0.3")
+        return
     dll_path = os.path.expandvars(dispatcher_comms_path)
     clr.AddReference(dll_path)
     import DispatcherComms
@@ -111,477 +252,2108 @@ def load_dispatcher_comms():
     globals()["Run8ProxyFactory"] = Run8ProxyFactory
     globals()["DispatcherProxyFactory"] = DispatcherProxyFactory
     globals()["EEngineerType"] = getattr(MessagesFromRun8, "EEngineerType", None)
+    if startup is not None:
+        startup.mark("DispatcherComms loaded")
 
 
 # =========================================================
 # DISCORD
 # =========================================================
-def announce_startup_complete():
-    """Emit the startup-complete message once train data is confirmed."""
-    global startup_complete_announced
-    if startup_complete_announced:
+def announce_startup_complete(server):
+    """Emit the startup-complete message once train data is confirmed, and the startup timing once every
+    server has processed its first event."""
+    if server.startup_complete_announced:
         return
     msg = messages.get("StartupCompleteMsg")
     if msg:
-        print(msg)
-        if discord_enabled and discord_status_channel:
-            discord_send(discord_status_channel, msg)
-    startup_complete_announced = True
+        msg = server.prefix + msg
+        server.emit(msg)
+        if discord_enabled and server.discord_status_channel:
+            discord_send(server.discord_status_channel, msg)
+    server.startup_complete_announced = True
+    if startup is not None:
+        startup.mark(f"{server.prefix}first event processed")
+        if server.early_replayed:
+            startup.note(f"{server.prefix}{server.early_replayed} events held for the sim clock")
+        if all(s.startup_complete_announced for s in servers):
+            emit(startup.report())
+
+
+class DiscordDispatcher:
+    """Outbound Discord queue per channel, drained on discord_loop under a token bucket.
+
+    Discord allows roughly DISCORD_RATE_MESSAGES messages per channel every
+    DISCORD_RATE_SECONDS. When a burst backs a channel up, queued lines are
+    packed into as few messages as fit in DISCORD_MAX_CHARS. submit() is safe
+    to call from any thread and never waits.
+
+    A dispatcher created with ready=False holds messages until open() is
+    called once the client has logged in, keeping the newest
+    DISCORD_EARLY_BUFFER per channel, so nothing said during startup is lost.
+    """
+
+    def __init__(self, client, loop, rate=DISCORD_RATE_MESSAGES, per=DISCORD_RATE_SECONDS, ready=True):
+        self.client = client
+        self.loop = loop
+        self.rate = rate
+        self.per = per
+        self.ready = ready
+        self.held = 0
+        self.dropped = 0
+        self.queued = 0
+        self.sent = 0
+        self.batched = 0
+        self.retried = 0
+        self.failed = 0
+        self._queues = {}
+        self._buckets = {}
+        self._channels = {}
+        self._draining = set()
+
+    def submit(self, channel_id, msg):
+        self.loop.call_soon_threadsafe(self._enqueue, channel_id, msg)
+
+    def _enqueue(self, channel_id, msg):
+        pending = self._queues.setdefault(channel_id, deque())
+        pending.append(msg[:DISCORD_MAX_CHARS])
+        self.queued += 1
+        if not self.ready:
+            self.held += 1
+            if len(pending) > DISCORD_EARLY_BUFFER:
+                pending.popleft()
+                self.dropped += 1
+            return
+        self._start_drain(channel_id)
+
+    def _start_drain(self, channel_id):
+        if channel_id not in self._draining:
+            self._draining.add(channel_id)
+            self.loop.create_task(self._drain(channel_id))
+
+    def open(self):
+        """The client is ready: send everything held so far, then deliver as messages arrive. Runs on the loop."""
+        self.ready = True
+        for channel_id, pending in self._queues.items():
+            if pending:
+                self._start_drain(channel_id)
+
+    async def _drain(self, channel_id):
+        pending = self._queues[channel_id]
+        try:
+            while pending:
+                await self._take_token(channel_id)
+                text, count = self._pack(pending)
+                if await self._deliver(channel_id, text):
+                    self.sent += 1
+                    if count > 1:
+                        self.batched += count
+        finally:
+            self._draining.discard(channel_id)
+
+    def _pack(self, pending):
+        """Join as many queued lines as fit in one message."""
+        lines = [pending.popleft()]
+        size = len(lines[0])
+        while pending and size + 1 + len(pending[0]) <= DISCORD_MAX_CHARS:
+            line = pending.popleft()
+            lines.append(line)
+            size += 1 + len(line)
+        return "\n".join(lines), len(lines)
+
+    async def _take_token(self, channel_id):
+        now = time.monotonic()
+        tokens, last = self._buckets.get(channel_id, (float(self.rate), now))
+        tokens = min(float(self.rate), tokens + (now - last) * self.rate / self.per)
+        if tokens < 1.0:
+            wait = (1.0 - tokens) * self.per / self.rate
+            await asyncio.sleep(wait)
+            now += wait
+            tokens = 1.0
+        self._buckets[channel_id] = (tokens - 1.0, now)
+
+    async def _deliver(self, channel_id, text):
+        for attempt in range(DISCORD_MAX_RETRIES + 1):
+            try:
+                channel = self._channels.get(channel_id)
+                if channel is None:
+                    channel = self.client.get_channel(channel_id)
+                    if channel is None:
+                        self.failed += 1
+                        return False
+                    self._channels[channel_id] = channel
+                await channel.send(text)
+                return True
+            except Exception as ex:
+                if attempt == DISCORD_MAX_RETRIES:
+                    self.failed += 1
+                    emit(f"[Discord] Giving up on message to channel {channel_id}: {ex!r}")
+                    return False
+                self.retried += 1
+                retry_after = getattr(ex, "retry_after", None)
+                await asyncio.sleep(retry_after if retry_after else 2 ** attempt)
+        return False
+
+    def stats(self):
+        return {"queued": self.queued, "sent": self.sent, "batched": self.batched, "retried": self.retried,
+                "failed": self.failed, "held": self.held, "dropped": self.dropped, "backlog": self.backlog()}
+
+    def backlog(self):
+        return sum(len(q) for q in self._queues.values())
 
 
 async def discord_start():
-    import discord
+    import discord  # discord.py and aiohttp take a while to import, so that happens here on the Discord thread
+    if startup is not None:
+        startup.mark("discord.py imported")
     intents = discord.Intents.default()
     client = discord.Client(intents=intents)
 
     async def on_ready():
-        print("[Discord] Speeder connected to Discord successfully.")
+        if discord_dispatcher.ready:
+            emit("[Discord] Speeder connected to Discord successfully.")
+            return
+        held = discord_dispatcher.backlog()
+        discord_dispatcher.open()
+        since = f" {startup.mark('Discord ready'):.1f}s after launch" if startup is not None else ""
+        emit(f"[Discord] Speeder connected to Discord successfully{since}, "
+             f"sending {held} messages queued during startup.")
 
     client.event(on_ready)
     globals()["discord_client"] = client
+    discord_dispatcher.client = client
 
     await client.start(discord_token)
 
 
 def start_discord_in_thread():
+    """Import discord.py and log in on a thread of its own.
+
+    The loop and dispatcher exist before this returns, so discord_send()
+    works from the start; messages wait in the dispatcher until the client is
+    ready.
+    """
+    global discord_loop, discord_dispatcher
     if not discord_enabled or not discord_token:
         return
+    discord_loop = asyncio.new_event_loop()
+    discord_dispatcher = DiscordDispatcher(None, discord_loop, ready=False)
 
     def runner():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        globals()["discord_loop"] = loop
-        loop.run_until_complete(discord_start())
+        asyncio.set_event_loop(discord_loop)
+        discord_loop.run_until_complete(discord_start())
 
     threading.Thread(target=runner, daemon=True).start()
 
 
 def discord_send(channel_id: int, msg: str):
-    if not discord_enabled or discord_client is None or discord_loop is None:
+    """Queue a Discord message; it is handed to the Discord loop from the output stage."""
+    if not discord_enabled:
         return
+    post_output(discord_send_now, channel_id, msg)
 
-    async def _send():
-        ch = discord_client.get_channel(channel_id)
-        if ch:
-            await ch.send(msg)
 
-    asyncio.run_coroutine_threadsafe(_send(), discord_loop)
+def discord_send_now(channel_id: int, msg: str):
+    if discord_dispatcher is None:
+        return
+    discord_dispatcher.submit(channel_id, msg)
 
 
-def discord_broadcast_alert(msg: str):
-    """Send alert-level messages to both alert and status channels when available."""
+def discord_broadcast_alert(server, msg: str):
+    """Send alert-level messages to both of the server's alert and status channels when available."""
     if not discord_enabled:
         return
-    if discord_alert_channel:
-        discord_send(discord_alert_channel, msg)
-    if discord_status_channel:
-        discord_send(discord_status_channel, msg)
+    if server.discord_alert_channel:
+        discord_send(server.discord_alert_channel, msg)
+    if server.discord_status_channel:
+        discord_send(server.discord_status_channel, msg)
 
 
 # =========================================================
 # EVENT HANDLERS
 # =========================================================
-def on_connected(sender, args):
-    global is_connected
-    is_connected = True
-    stamp = str(last_sim_time) if last_sim_time else time.strftime("%H:%M:%S")
-    msg = messages.get("ConnectedMsg")
-    if msg:
-        formatted = msg.format(stamp=stamp)
-        print(formatted)
-        if discord_enabled and discord_status_channel:
-            discord_send(discord_status_channel, formatted)
+def on_connected(server, sender, args):
+    server.is_connected = True
+    if startup is not None:
+        startup.mark(f"{server.prefix}connected")
+    stamp = str(server.last_sim_time) if server.last_sim_time else time.strftime("%H:%M:%S")
+    formatted = server.msg("ConnectedMsg", stamp=stamp)
+    if formatted:
+        server.emit(formatted)
+        if discord_enabled and server.discord_status_channel:
+            discord_send(server.discord_status_channel, formatted)
+
 
+def on_disconnected(server, sender, args):
+    server.is_connected = False
+    emit_disconnected_message(server)
 
-def on_disconnected(sender, args):
-    global is_connected
-    is_connected = False
-    emit_disconnected_message()
 
 
 
+def on_dispatcher_permission(server, sender, args):
+    server.has_permission = str(args.Permission) == "Granted"
 
-def on_dispatcher_permission(sender, args):
-    global has_permission
-    has_permission = str(args.Permission) == "Granted"
 
+def on_simulation_state(server, sender, args):
+    """Track the sim clock: the DateTime for display, and monotonic float seconds for all time math.
 
-def on_simulation_state(sender, args):
-    global last_sim_time
-    last_sim_time = args.SimulationTime
+    The float clock advances by the tick delta between updates and never runs
+    backwards, so a sim clock reset on the server cannot expire or resurrect
+    timers.
+    """
+    sim_time = args.SimulationTime
+    ticks = sim_time.Ticks
+    if server.last_sim_seconds is None:
+        server.last_sim_seconds = 0.0
+        if startup is not None:
+            startup.mark(f"{server.prefix}sim clock")
+    elif ticks > server.last_sim_ticks:
+        server.last_sim_seconds += (ticks - server.last_sim_ticks) / TICKS_PER_SECOND
+    server.last_sim_ticks = ticks
+    server.last_sim_time = sim_time
+    if server.recorder is not None:
+        server.recorder.clock(server.last_sim_seconds, ticks)
+    if server.early_updates:
+        replay_early_updates(server)
 
 
 # =========================================================
 # MESSAGE HELPERS
 # =========================================================
+# Placeholders each message may use; None means the text is sent as-is, unformatted.
+# Keys used by format_msg without a fallback must be present in the settings.
+MESSAGE_FIELDS = {
+    "ConnectedMsg": ("stamp",),
+    "DisconnectedMsg": ("stamp",),
+    "SpeedingStartMsg": ("sim_now", "train", "train_id", "current", "limit", "block"),
+    "SpeedingEndMsg": ("sim_now", "train", "train_id", "duration", "max_over", "block"),
+    "OvrSpeedBanMsg": ("sim_now", "train", "train_id", "current", "limit", "block", "over"),
+    "SustSpeedBanMsg": ("sim_now", "train", "train_id", "current", "limit", "block", "minutes"),
+    "CoupledMsg": ("sim_now", "train", "prev_axles", "curr_axles", "speed", "approach_max", "approach_decel"),
+    "TrainTimeoutMsg": ("sim_now", "train_id"),
+    "RelinquishMsg": ("sim_now", "train"),
+    "TookControlMsg": ("sim_now", "train"),
+    "AutomatedNoticeMsg": ("train",),
+    "ZeroLimitMsg": ("train",),
+    "AlertStormMsg": ("sim_now", "block", "trains", "window", "limit"),
+    "AlertStormEndMsg": ("sim_now", "block", "trains", "alerts", "minutes"),
+    "StartupCompleteMsg": None,
+    "PeriodicAnnounceMsg": None,
+}
+# Used when an older settings file does not have the message.
+MESSAGE_DEFAULTS = {
+    "AlertStormMsg": "[{sim_now}] {trains} trains over the limit in block {block} within {window:.0f} seconds, "
+                     "the {limit:.0f} MPH limit there may be wrong. Holding back further alerts for this block.",
+    "AlertStormEndMsg": "[{sim_now}] Block {block} has calmed down after {minutes:.1f} minutes: {trains} trains, "
+                        "{alerts} alerts held back (see the console log for each one).",
+}
+REQUIRED_MESSAGES = ("SpeedingStartMsg", "SpeedingEndMsg", "OvrSpeedBanMsg", "SustSpeedBanMsg", "CoupledMsg",
+                     "TrainTimeoutMsg", "RelinquishMsg", "TookControlMsg")
+# Left out of the settings file, these are simply not sent.
+OPTIONAL_MESSAGES = ("AutomatedNoticeMsg", "ZeroLimitMsg")
+FORMAT_CONVERSIONS = {"s": str, "r": repr, "a": ascii}
+
+
+class MessageTemplate:
+    """A message parsed once at startup into literal text and field lookups.
+
+    Rendering walks the precompiled parts instead of re-parsing the template
+    with str.format on every alert. train_fields lists the snapshot fields the
+    template reads.
+    """
+    __slots__ = ("key", "text", "parts", "train_fields")
+
+    def __init__(self, key, text, allowed):
+        self.key = key
+        self.text = text
+        self.parts = []
+        self.train_fields = set()
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if field is None:
+                self.parts.append((literal, None, None, None, ""))
+                continue
+            if not field or "[" in field or (spec and "{" in spec):
+                raise ValueError(f"unsupported placeholder {{{field}}}")
+            root, _, path = field.partition(".")
+            if root not in allowed:
+                raise ValueError(f"unknown placeholder {{{field}}}, expected one of {', '.join(allowed) or 'none'}")
+            getter = None
+            if path:
+                if root != "train":
+                    raise ValueError(f"unknown placeholder {{{field}}}")
+                if path not in TrainSnapshot.__slots__:
+                    raise ValueError(f"unknown train field {{{field}}}, "
+                                     f"expected one of {', '.join(TrainSnapshot.__slots__)}")
+                self.train_fields.add(path)
+                getter = attrgetter(path)
+            if conversion and conversion not in FORMAT_CONVERSIONS:
+                raise ValueError(f"unknown conversion !{conversion} in {{{field}}}")
+            self.parts.append((literal, root, getter, FORMAT_CONVERSIONS.get(conversion), spec or ""))
+
+    def render(self, values):
+        out = []
+        for literal, root, getter, convert, spec in self.parts:
+            if literal:
+                out.append(literal)
+            if root is None:
+                continue
+            value = values[root]
+            if getter is not None:
+                value = getter(value)
+            if convert is not None:
+                value = convert(value)
+            out.append(format(value, spec))
+        return "".join(out)
+
+    def uses(self, root):
+        return any(part[1] == root for part in self.parts)
+
+
+def sample_message_values():
+    """Representative values for a dry-run render of every template at startup."""
+    train = TrainSnapshot.__new__(TrainSnapshot)
+    for name in TrainSnapshot.__slots__:
+        setattr(train, name, "")
+    train.TrainID = train.BlockID = train.AxleCount = train.LocoNumber = 1
+    train.TrainSpeedMph = train.TrainSpeedLimitMPH = train.HpPerTon = 1.0
+    values = dict.fromkeys(("current", "limit", "over", "duration", "max_over", "minutes", "speed", "window",
+                            "approach_max", "approach_decel"), 1.0)
+    values.update(dict.fromkeys(("train_id", "block", "prev_axles", "curr_axles", "trains", "alerts"), 1))
+    values.update(sim_now="01/01/2026 08:00:00 AM", stamp="08:00:00", train=train)
+    return values
+
+
+def compile_messages(raw):
+    """Compile the Messages settings; returns (templates, errors)."""
+    compiled, errors = {}, []
+    sample = sample_message_values()
+    for key in REQUIRED_MESSAGES:
+        if not raw.get(key):
+            errors.append(f"Messages.{key} is missing")
+    for key, text in {**MESSAGE_DEFAULTS, **raw}.items():
+        allowed = MESSAGE_FIELDS.get(key)
+        if allowed is None or not text:
+            continue
+        try:
+            template = MessageTemplate(key, text, allowed)
+            template.render(sample)
+        except (ValueError, TypeError) as ex:
+            errors.append(f"Messages.{key}: {ex}")
+            continue
+        compiled[key] = template
+    return compiled, errors
+
+
 def format_msg(key, **kwargs):
-    if key not in messages:
+    """Render a compiled message; None when it is left blank, or is optional and left out."""
+    template = templates.get(key)
+    if template is None:
+        if key in messages or key in OPTIONAL_MESSAGES:
+            return None
         return "*ERROR: SpeederSettings.json key is not in messages*"
     try:
-        return messages[key].format(**kwargs)
-    except Exception:
+        return template.render(kwargs)
+    except Exception as ex:
+        emit(f"[Speeder] Formatting {key} failed: {ex!r}")
         return "*ERROR: An exception has occurred during message formatting. See the console for more details.*"
 
 
-def emit_disconnected_message():
+def emit_disconnected_message(server):
     """Send the standard disconnected message to terminal and Discord."""
-    global data_timeout_announced
-    stamp = str(last_sim_time) if last_sim_time else time.strftime("%H:%M:%S")
-    msg = messages.get("DisconnectedMsg")
-    if not msg:
+    stamp = str(server.last_sim_time) if server.last_sim_time else time.strftime("%H:%M:%S")
+    formatted = server.msg("DisconnectedMsg", stamp=stamp)
+    if not formatted:
         return
-    formatted = msg.format(stamp=stamp)
-    print(formatted)
-    if discord_enabled and discord_status_channel:
-        discord_send(discord_status_channel, formatted)
-    data_timeout_announced = True
+    server.emit(formatted)
+    if discord_enabled and server.discord_status_channel:
+        discord_send(server.discord_status_channel, formatted)
+    server.data_timeout_announced = True
+
+
+# =========================================================
+# PIPELINE
+# =========================================================
+class IngestQueue:
+    """Bounded queue of TrainUpdates between the DispatcherComms callback and the detection worker.
+
+    A train with an update already waiting has it replaced in place by the newer
+    one (it keeps its place in line) unless the engineer type or axle count
+    changed, since those transitions must reach the detectors in order. When
+    the queue is full new updates are dropped and counted; put() never blocks.
+    A replaced update can end up stamped later than the ones behind it, so
+    process_train_update holds each server's sim time to never run backwards.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._items = deque()
+        self._latest = {}
+        self._unfinished = 0
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, update):
+        with self._cond:
+            pending = self._latest.get(update.train_id)
+            if pending is not None and pending.can_absorb(update):
+                pending.absorb(update)
+                self.coalesced += 1
+                return
+            if len(self._items) >= self.maxsize:
+                self.dropped += 1
+                return
+            self._items.append(update)
+            self._latest[update.train_id] = update
+            self._unfinished += 1
+            self.enqueued += 1
+            if len(self._items) > self.max_depth:
+                self.max_depth = len(self._items)
+            self._cond.notify()
+
+    def get(self, timeout):
+        """Next update, or None if nothing arrived within `timeout` seconds."""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+                if not self._items:
+                    return None
+            update = self._items.popleft()
+            if self._latest.get(update.train_id) is update:
+                del self._latest[update.train_id]
+            return update
+
+    def task_done(self):
+        with self._cond:
+            self._unfinished -= 1
+            if not self._unfinished:
+                self._cond.notify_all()
+
+    def join(self):
+        with self._cond:
+            while self._unfinished:
+                self._cond.wait()
+
+    def stats(self):
+        return {"depth": len(self._items), "max_depth": self.max_depth, "enqueued": self.enqueued,
+                "coalesced": self.coalesced, "dropped": self.dropped}
+
+
+class OutputStage:
+    """FIFO of side effects (console, Discord, radio) run in order on their own thread."""
+
+    def __init__(self):
+        self.failed = 0
+        self._queue = queue.Queue()
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def post(self, fn, *args):
+        self._queue.put((fn, args))
+
+    def run(self):
+        while True:
+            fn, args = self._queue.get()
+            try:
+                fn(*args)
+            except Exception as ex:
+                self.failed += 1
+                emit(f"[Speeder] Output error in {getattr(fn, '__name__', fn)}: {ex!r}")
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        self._queue.join()
+
+
+def post_output(fn, *args):
+    """Run a side effect on the output stage, or inline when the pipeline is not running."""
+    if output_stage is None:
+        fn(*args)
+    else:
+        output_stage.post(fn, *args)
+
+
+def emit(msg, sim_time=None):
+    """Log a message to the console (and log file) without blocking the caller."""
+    if log_sink is None:
+        print(msg)
+    else:
+        log_sink.write(msg, sim_time)
+
+
+def detection_worker(server):
+    """Consume one server's queued TrainData and run the detectors. Idle wake-ups keep deadlines firing."""
+    ingest_queue = server.ingest_queue
+    while True:
+        update = ingest_queue.get(DEADLINE_POLL_SECONDS)
+        if update is None:
+            run_deadlines(server, server.last_sim_seconds)
+            continue
+        try:
+            process_train_update(server, update)
+        except Exception as ex:
+            emit(f"{server.prefix}[Speeder] Error processing TrainData for {update.train_id}: {ex!r}")
+        finally:
+            ingest_queue.task_done()
+
+
+def start_pipeline():
+    """Start the shared log writer and output stage, and each server's detection worker and radio thread."""
+    global output_stage, log_sink
+    log_sink = LogSink(LOG_BUFFER_SIZE, log_file, log_max_bytes, log_rotate_seconds, log_backups, log_json)
+    threading.Thread(target=log_sink.run, daemon=True).start()
+    output_stage = OutputStage()
+    threading.Thread(target=output_stage.run, daemon=True).start()
+    for server in servers:
+        server.ingest_queue = IngestQueue(INGEST_QUEUE_SIZE)
+        server.radio_sender = RadioSender(server)
+        threading.Thread(target=detection_worker, args=(server,), daemon=True).start()
+        threading.Thread(target=server.radio_sender.run, daemon=True).start()
+
+
+def start_recorder():
+    """Record each server's raw TrainData stream to RecordDir, if set (see R8Recorder.py).
+
+    With more than one server, each is recorded to a subfolder named after it.
+    """
+    if not record_dir:
+        return
+    import R8Recorder
+    for server in servers:
+        directory = os.path.expandvars(record_dir)
+        if len(servers) > 1:
+            directory = os.path.join(directory, server.name)
+        server.recorder = R8Recorder.Recorder(directory, int(record_segment_mb * 1024 * 1024),
+                                              int(EEngineerType.Player))
+        emit(f"{server.prefix}[Speeder] Recording TrainData to {server.recorder.directory}")
+
+
+def start_history():
+    """Keep the violation history database in HistoryFile, if set (see R8History.py)."""
+    global history
+    if not history_file:
+        return
+    import R8History
+    history = R8History.HistoryStore(os.path.expandvars(history_file))
+    threading.Thread(target=history.run, daemon=True).start()
+    emit(f"[Speeder] Writing violation history to {history.path}")
+
+
+def log_history(server, kind, snap, train_id, sim_now, amount=None, peak=None):
+    """Queue an event for the violation history database; a no-op when HistoryFile is not set."""
+    if history is not None:
+        history.add(kind, sim_now, snap, train_id, amount, peak, server.name if server.prefix else None)
+
+
+def flush_pipeline():
+    """Block until every queued event has been processed and its output sent."""
+    for server in servers:
+        if server.ingest_queue is not None:
+            server.ingest_queue.join()
+    if output_stage is not None:
+        output_stage.join()
+    if history is not None:
+        history.flush()
+    if log_sink is not None:
+        log_sink.flush()
+
+
+def flush_on_exit(timeout=EXIT_FLUSH_SECONDS):
+    """Give output still queued a bounded chance to be written before the process exits.
+
+    The writer threads are daemons, so without this the last messages before
+    Ctrl+C never reach the console or LogFile, nor the last history rows the
+    database.
+    """
+    if history is not None and not history.flush(timeout):
+        emit(f"[Speeder] History still had events queued after {timeout:g}s, exiting anyway")
+    if log_sink is not None and not log_sink.flush(timeout):
+        sys.__stderr__.write(f"[Speeder] Log still had messages queued after {timeout:g}s, exiting anyway\n")
+
+
+def pipeline_stats():
+    """Ingest and update counters summed over every server, plus the shared output stage and log."""
+    stats = {}
+    for server in servers:
+        server_stats = server.ingest_queue.stats() if server.ingest_queue is not None else {}
+        server_stats["updates"] = server.updates_processed
+        server_stats["unchanged"] = server.updates_unchanged
+        for key, value in server_stats.items():
+            stats[key] = max(stats.get(key, 0), value) if key == "max_depth" else stats.get(key, 0) + value
+    stats["output_depth"] = len(output_stage) if output_stage is not None else 0
+    if log_sink is not None:
+        stats["log"] = log_sink.stats()
+    return stats
+
+
+# =========================================================
+# LOG SINK
+# =========================================================
+class LogSink:
+    """Console and log file writer fed from a bounded buffer and drained on its own thread.
+
+    write() only appends to a deque (atomic in CPython, no lock taken), so a
+    slow console or disk never holds up the detectors. When the buffer is full
+    messages are dropped and counted instead. The writer sends whatever has
+    built up in one write per destination, rotates the log file by size and
+    age, and can write the file as JSON lines with wall and sim timestamps.
+    The file is written before the console, and a failure in one (say a
+    console that cannot encode an engineer's name) does not cost the other
+    its copy of the batch.
+    """
+
+    def __init__(self, capacity, path="", max_bytes=0, rotate_seconds=0, backups=5, json_lines=False):
+        self.capacity = capacity
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backups = backups
+        self.json_lines = json_lines
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._reported_drops = 0
+        self._buffer = deque()
+        self._wake = threading.Event()
+        self._file = None
+        self._file_size = 0
+        self._file_opened = 0.0
+
+    def write(self, msg, sim_time=None):
+        if len(self._buffer) >= self.capacity:
+            self.dropped += 1
+            return
+        self._buffer.append((time.time(), sim_time, msg))
+        if not self._wake.is_set():
+            self._wake.set()
+
+    def run(self):
+        while True:
+            self._wake.wait(LOG_FLUSH_SECONDS)
+            self._wake.clear()
+            batch, flushed = [], []
+            while self._buffer:
+                item = self._buffer.popleft()
+                if isinstance(item, threading.Event):
+                    flushed.append(item)
+                else:
+                    batch.append(item)
+            self.written += len(batch)
+            if self.dropped != self._reported_drops:
+                batch.append((time.time(), None,
+                              f"[Speeder] Log buffer full, dropped {self.dropped - self._reported_drops} messages"))
+                self._reported_drops = self.dropped
+            if batch:
+                for destination, write in (("file", self._write_file), ("console", self._write_console)):
+                    try:
+                        write(batch)
+                    except Exception as ex:
+                        sys.__stderr__.write(f"[Speeder] Log {destination} write failed: {ex!r}\n")
+            for event in flushed:
+                event.set()
+
+    def _write_console(self, batch):
+        sys.stdout.write("".join(msg + "\n" for _, _, msg in batch))
+        sys.stdout.flush()
+
+    def _write_file(self, batch):
+        if not self.path:
+            return
+        if self.json_lines:
+            text = "".join(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(ts)),
+                                       "sim_time": str(sim) if sim is not None else None,
+                                       "msg": msg}) + "\n" for ts, sim, msg in batch)
+        else:
+            text = "".join(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))} {msg}\n"
+                           for ts, _, msg in batch)
+        data = text.encode("utf-8")
+        self._open_for(len(data))
+        self._file.write(data)
+        self._file.flush()
+        self._file_size += len(data)
+
+    def _open_for(self, size):
+        now = time.time()
+        if self._file is not None:
+            too_big = self.max_bytes and self._file_size and self._file_size + size > self.max_bytes
+            too_old = self.rotate_seconds and now - self._file_opened >= self.rotate_seconds
+            if not (too_big or too_old):
+                return
+            self._file.close()
+            self._file = None
+            self._rotate()
+        self._file = open(self.path, "ab")
+        self._file_size = self._file.tell()
+        self._file_opened = now
+
+    def _rotate(self):
+        """Shift Speeder.log -> Speeder.log.1 -> ... keeping `backups` old files."""
+        self.rotations += 1
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def flush(self, timeout=None):
+        """Block until everything written so far has reached the console and file, or for at most
+        `timeout` seconds; True if it got there."""
+        done = threading.Event()
+        self._buffer.append(done)
+        self._wake.set()
+        return done.wait(timeout)
+
+    def stats(self):
+        return {"buffered": len(self._buffer), "written": self.written, "dropped": self.dropped,
+                "rotations": self.rotations}
+
+
+# =========================================================
+# RADIO
+# =========================================================
+class RadioSender:
+    """Dedicated thread for SendRadioText, so radio calls never hold up event processing.
+
+    Each transmission is the lines sent back to back (normally
+    AutomatedNoticeMsg and the body). Transmissions are spaced at least
+    RADIO_MIN_INTERVAL_SECONDS apart, identical ones within
+    RADIO_DEDUPE_SECONDS are dropped, and zero-limit notices raised within
+    RADIO_MERGE_SECONDS of each other go out as one call naming every engineer.
+    One per server, sending through that server's proxy.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.sent = 0
+        self.deduped = 0
+        self.merged = 0
+        self._pending = deque()
+        self._zero_limit = []
+        self._zero_limit_due = 0.0
+        self._recent = {}
+        self._last_sent = 0.0
+        self._busy = False
+        self._cond = threading.Condition()
+
+    def notice(self, body, dedupe=True):
+        lines = tuple(line for line in (automated_notice(), body) if line)
+        with self._cond:
+            self._pending.append((lines, dedupe))
+            self._cond.notify()
+
+    def zero_limit(self, snap):
+        with self._cond:
+            if not self._zero_limit:
+                self._zero_limit_due = time.monotonic() + RADIO_MERGE_SECONDS
+            self._zero_limit.append(snap)
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._zero_limit and now >= self._zero_limit_due:
+                        self._pending.append((self._merge_zero_limit(), True))
+                    if self._pending:
+                        lines, dedupe = self._pending.popleft()
+                        self._busy = True
+                        break
+                    self._cond.wait(self._zero_limit_due - now if self._zero_limit else None)
+            try:
+                self._transmit(lines, dedupe)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _merge_zero_limit(self):
+        snaps, self._zero_limit = self._zero_limit, []
+        if len(snaps) > 1:
+            self.merged += len(snaps)
+        names = ", ".join(dict.fromkeys(snap.EngineerName for snap in snaps))
+        snap = snaps[0].with_fields(EngineerName=names)
+        lines = (automated_notice(snap), format_msg("ZeroLimitMsg", train=snap))
+        return tuple(line for line in lines if line)
+
+    def _transmit(self, lines, dedupe):
+        proxy = self.server.proxy
+        if not lines or not proxy:
+            return
+        now = time.monotonic()
+        if dedupe and now - self._recent.get(lines, -RADIO_DEDUPE_SECONDS) < RADIO_DEDUPE_SECONDS:
+            self.deduped += 1
+            return
+        wait = self._last_sent + RADIO_MIN_INTERVAL_SECONDS - now
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            for line in lines:
+                send_radio_text(proxy, line)
+        except Exception as ex:
+            emit(f"{self.server.prefix}[Speeder] Radio send failed: {ex!r}")
+        self._last_sent = time.monotonic()
+        self.sent += 1
+        if dedupe:
+            if len(self._recent) > 64:
+                cutoff = self._last_sent - RADIO_DEDUPE_SECONDS
+                self._recent = {k: t for k, t in self._recent.items() if t > cutoff}
+            self._recent[lines] = self._last_sent
+
+    def flush(self):
+        """Send anything waiting, including a partly gathered zero-limit merge, and wait for it."""
+        with self._cond:
+            self._zero_limit_due = 0.0
+            self._cond.notify_all()
+            while self._pending or self._zero_limit or self._busy:
+                self._cond.wait()
+
+    def stats(self):
+        return {"pending": len(self._pending), "sent": self.sent, "deduped": self.deduped, "merged": self.merged}
+
+
+def automated_notice(train=None):
+    """AutomatedNoticeMsg for a radio transmission about `train`.
+
+    The 0 MPH limit notice has always passed the train, so settings files may
+    use {train...} here; a notice about no train in particular (the periodic
+    announcement) then goes out as written, as it always has.
+    """
+    template = templates.get("AutomatedNoticeMsg")
+    if train is None and template is not None and template.uses("train"):
+        return messages["AutomatedNoticeMsg"]
+    return format_msg("AutomatedNoticeMsg", train=train)
+
+
+def send_radio_text(proxy, line):
+    proxy.SendRadioText(DISPATCHER_RADIO_CHANNEL, line)
+
+
+def radio_notice(server, body, dedupe=True):
+    """Queue an automated notice for the radio thread, or send it inline when that is not running."""
+    if server.radio_sender is not None:
+        server.radio_sender.notice(body, dedupe)
+    elif server.proxy:
+        for line in (automated_notice(), body):
+            if line:
+                send_radio_text(server.proxy, line)
+
+
+def radio_zero_limit(server, snap):
+    """Tell an engineer their train has a 0 MPH limit; simultaneous notices are merged."""
+    if server.radio_sender is not None:
+        server.radio_sender.zero_limit(snap)
+    elif server.proxy:
+        for line in (automated_notice(snap), format_msg("ZeroLimitMsg", train=snap)):
+            if line:
+                send_radio_text(server.proxy, line)
+
+
+# =========================================================
+# TRAIN SNAPSHOT
+# =========================================================
+class TrainSnapshot:
+    """Plain-Python copy of the Train fields the bot uses, read once per event.
+
+    Every property read on e.Train is a pythonnet round trip, so each TrainData
+    event marshals the fields exactly once here and the handlers and message
+    templates work off this object instead of the live proxy. The
+    OPTIONAL_FIELDS are only read when some message template uses them.
+    """
+    OPTIONAL_FIELDS = ("RailroadInitials", "LocoNumber")
+    __slots__ = ("TrainID", "EngineerType", "EngineerName", "TrainSymbol", "TrainSpeedMph",
+                 "TrainSpeedLimitMPH", "BlockID", "AxleCount", "HpPerTon", "RailroadInitials", "LocoNumber")
+
+    def __init__(self, train, train_id, engineer_type):
+        self.TrainID = train_id
+        self.EngineerType = engineer_type
+        self.EngineerName = str(train.EngineerName)
+        self.TrainSymbol = str(train.TrainSymbol)
+        self.TrainSpeedMph = float(train.TrainSpeedMph)
+        try:
+            self.TrainSpeedLimitMPH = float(train.TrainSpeedLimitMPH)
+        except Exception:
+            self.TrainSpeedLimitMPH = 0.0
+        self.BlockID = int(train.BlockID)
+        self.AxleCount = int(train.AxleCount)
+        self.HpPerTon = float(train.HpPerTon)
+        optional = snapshot_optional_fields
+        self.RailroadInitials = str(train.RailroadInitials) if "RailroadInitials" in optional else ""
+        self.LocoNumber = train.LocoNumber if "LocoNumber" in optional else ""
+
+    def with_fields(self, **fields):
+        """Copy of this snapshot with some fields replaced."""
+        clone = TrainSnapshot.__new__(TrainSnapshot)
+        for name in TrainSnapshot.__slots__:
+            setattr(clone, name, fields.get(name, getattr(self, name)))
+        return clone
+
+
+# Everything a handler or message can read from a snapshot, as a tuple; see TrainState.fingerprint.
+snapshot_fingerprint = attrgetter("EngineerName", "TrainSymbol", "TrainSpeedMph", "TrainSpeedLimitMPH", "BlockID",
+                                  "AxleCount", "HpPerTon", "RailroadInitials", "LocoNumber")
+
+
+# =========================================================
+# TRAIN STATE
+# =========================================================
+class TrainState:
+    """Everything tracked for one train. Timestamps are sim seconds.
+
+    A train that has ever reported keeps its last engineer type here so a
+    Player -> AI transition can be spotted; the remaining fields only carry
+    values while the train is an active player train.
+
+    `history` is the train's R8Stats.SpeedHistory: recent speed, limit and
+    axle samples, created when a player first reports and appended once per
+    update, unchanged ones included, after the detectors have run.
+
+    `fingerprint` is snapshot_fingerprint() of the last snapshot, kept only
+    while nothing is waiting on the clock (speeding or a 0 MPH limit being
+    confirmed, or a sustained-speeding alert still to come). A player update
+    with the same fingerprint then cannot change anything, so
+    process_train_update just marks the train as seen.
+    """
+    __slots__ = ("train_id", "engineer_type", "last_update", "last_seen", "last_snap", "player_name",
+                 "train_symbol", "last_speed", "rule_key", "rule_mask", "speed_exceed_start", "speeding_start",
+                 "max_overspeed", "overspeed_warned", "sustained_warned", "history", "axle_blocked_until",
+                 "zero_limit_pending", "zero_limit_announced", "fingerprint")
+
+    def __init__(self, train_id, engineer_type):
+        self.train_id = train_id
+        self.engineer_type = engineer_type
+        self.last_update = 0.0
+        self.last_seen = None
+        self.last_snap = None
+        self.player_name = ""
+        self.train_symbol = ""
+        self.last_speed = 0.0
+        self.rule_key = None
+        self.rule_mask = 0
+        self.speed_exceed_start = None
+        self.speeding_start = None
+        self.max_overspeed = 0.0
+        self.overspeed_warned = False
+        self.sustained_warned = False
+        self.history = None
+        self.axle_blocked_until = None
+        self.zero_limit_pending = None
+        self.zero_limit_announced = False
+        self.fingerprint = None
+
+
+class TrainStore:
+    """Bounded TrainID -> TrainState registry with sim-time TTL and LRU eviction.
+
+    Entries are kept in least-recently-updated order, so both the TTL sweep and
+    the over-cap eviction only ever pop from the front. AI trains that spawn and
+    despawn all day therefore cost nothing once they go quiet.
+    """
+
+    def __init__(self, cap, ttl):
+        self.cap = cap
+        self.ttl = ttl
+        self.evicted_ttl = 0
+        self.evicted_lru = 0
+        self._states = OrderedDict()
+
+    def __len__(self):
+        return len(self._states)
+
+    def get(self, train_id):
+        return self._states.get(train_id)
+
+    def values(self):
+        return self._states.values()
+
+    def touch(self, train_id, engineer_type, now):
+        """Return the train's state, creating it if needed, and mark it as updated at `now`."""
+        states = self._states
+        state = states.get(train_id)
+        if state is None:
+            state = states[train_id] = TrainState(train_id, engineer_type)
+            if len(states) > self.cap:
+                states.popitem(last=False)
+                self.evicted_lru += 1
+        else:
+            states.move_to_end(train_id)
+        state.last_update = now
+        return state
+
+    def reset(self, state):
+        """Drop all player tracking for a train, keeping only its last engineer type."""
+        fresh = TrainState(state.train_id, state.engineer_type)
+        fresh.last_update = state.last_update
+        if state.history is not None:
+            fresh.history = state.history
+            fresh.history.clear()
+        if state.train_id in self._states:
+            self._states[state.train_id] = fresh
+        return fresh
+
+    def expire(self, now):
+        """Evict every train that has not reported for `ttl` sim seconds."""
+        states = self._states
+        cutoff = now - self.ttl
+        while states:
+            train_id, state = next(iter(states.items()))
+            if state.last_update >= cutoff:
+                break
+            del states[train_id]
+            self.evicted_ttl += 1
+
+    def stats(self):
+        return {"size": len(self._states), "cap": self.cap,
+                "evicted_ttl": self.evicted_ttl, "evicted_lru": self.evicted_lru}
+
+
+# =========================================================
+# DEADLINES
+# =========================================================
+class DeadlineScheduler:
+    """Min-heap of per-train deadlines keyed on sim seconds.
+
+    A deadline fires once sim time has passed it. Entries are never cancelled:
+    callbacks re-check the train's state and do nothing if the condition has
+    since cleared, and entries for trains that were reset or evicted are dropped
+    without a call. Work per tick is O(expired), not O(tracked trains).
+    Callbacks are called as callback(server, state, now). Callers hold the
+    server's lock.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self._heap = []
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, when, callback, state):
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, callback, state))
+
+    def due(self, now):
+        return bool(self._heap) and self._heap[0][0] < now
+
+    def run_due(self, now):
+        heap = self._heap
+        server = self.server
+        trains = server.trains
+        while heap and heap[0][0] < now:
+            _, _, callback, state = heapq.heappop(heap)
+            if trains.get(state.train_id) is state:
+                callback(server, state, now)
+
+
+def run_deadlines(server, now):
+    """Fire every deadline of `server` that is due at sim time `now`, and end alert storms that have gone quiet."""
+    if now is not None and (server.deadlines.due(now) or server.alert_storms.due(now)):
+        with server.lock:
+            now = max(now, server.last_processed_now)
+            server.last_processed_now = now
+            server.deadlines.run_due(now)
+            server.alert_storms.expire(now)
+
+
+# =========================================================
+# ALERT CORRELATION
+# =========================================================
+class AlertStorm:
+    __slots__ = ("block", "started", "last", "trains", "held")
+
+    def __init__(self, block, now, train_ids):
+        self.block = block
+        self.started = now
+        self.last = now
+        self.trains = set(train_ids)
+        self.held = 0
+
+
+class AlertCorrelator:
+    """Groups speeding alerts by block so one bad speed limit can't flood Discord.
+
+    Every alert is still printed, logged and stored; admit() only decides
+    whether it is also posted to Discord. Once `storm_trains` different
+    trains have alerted in one block within `window` sim seconds, a single
+    AlertStormMsg goes out instead and the block's alerts are held back until
+    it has been quiet for a window, when AlertStormEndMsg reports how many
+    were held. Role pings are limited to one per `ping_interval`. One per
+    server; callers hold the server's lock. expire() also runs from the
+    detection worker's idle polls, so a storm in a block that has gone silent
+    still ends.
+    """
+
+    def __init__(self, server, storm_trains, window, ping_interval):
+        self.server = server
+        self.storm_trains = storm_trains
+        self.window = window
+        self.ping_interval = ping_interval
+        self.admitted = 0
+        self.held = 0
+        self.storms = 0
+        self.pings_throttled = 0
+        self._recent = {}
+        self._active = {}
+        self._last_ping = None
+        self._next_sweep = 0.0
+
+    def admit(self, snap, train_id, now, counts=True):
+        """Whether to post this alert to Discord. `counts` is False for follow-ups such as SpeedingEndMsg."""
+        block = snap.BlockID
+        storm = self._active.get(block)
+        if storm is not None:
+            storm.last = now
+            storm.trains.add(train_id)
+            storm.held += 1
+            self.held += 1
+            return False
+        if not counts or self.storm_trains <= 0:
+            self.admitted += 1
+            return True
+        recent = self._recent.get(block)
+        if recent is None:
+            recent = self._recent[block] = OrderedDict()
+        recent.pop(train_id, None)
+        recent[train_id] = now
+        cutoff = now - self.window
+        while next(iter(recent.values())) < cutoff:
+            recent.popitem(last=False)
+        if len(recent) < self.storm_trains:
+            self.admitted += 1
+            return True
+        self._start(block, recent, snap, now)
+        return False
+
+    def _start(self, block, recent, snap, now):
+        storm = self._active[block] = AlertStorm(block, now, recent)
+        storm.held = 1
+        del self._recent[block]
+        self.storms += 1
+        self.held += 1
+        server = self.server
+        msg = server.msg("AlertStormMsg", sim_now=server.last_sim_time, block=block, trains=len(storm.trains),
+                         window=self.window, limit=snap.TrainSpeedLimitMPH)
+        server.emit(msg)
+        if discord_enabled:
+            if server.discord_alert_role != 0 and server.discord_alert_channel and self.ping(now):
+                msg = "<@&" + str(server.discord_alert_role) + "> - " + msg
+            discord_broadcast_alert(server, msg)
+
+    def due(self, now):
+        """Whether expire() has anything to do at `now`."""
+        if self._recent and now >= self._next_sweep:
+            return True
+        return any(now - storm.last > self.window for storm in self._active.values())
+
+    def expire(self, now):
+        """Close storms in blocks that have been quiet for a full window, and, once a window, forget blocks
+        whose recent alerts have all aged out."""
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.window
+            cutoff = now - self.window
+            for block in [block for block, recent in self._recent.items() if next(reversed(recent.values())) < cutoff]:
+                del self._recent[block]
+        if not self._active:
+            return
+        server = self.server
+        for block, storm in list(self._active.items()):
+            if now - storm.last <= self.window:
+                continue
+            del self._active[block]
+            msg = server.msg("AlertStormEndMsg", sim_now=server.last_sim_time, block=block, trains=len(storm.trains),
+                             alerts=storm.held, minutes=(storm.last - storm.started) / 60.0)
+            server.emit(msg)
+            if discord_enabled:
+                discord_broadcast_alert(server, msg)
+
+    def ping(self, now):
+        """Whether a role ping may be added now; at most one per ping_interval."""
+        if self._last_ping is not None and now - self._last_ping < self.ping_interval:
+            self.pings_throttled += 1
+            return False
+        self._last_ping = now
+        return True
+
+    def stats(self):
+        return {"admitted": self.admitted, "held": self.held, "storms": self.storms, "blocks": len(self._recent),
+                "active": len(self._active), "pings_throttled": self.pings_throttled}
+
+
+# =========================================================
+# SPEED RULES
+# =========================================================
+class SpeedRule:
+    """One SpeedRules entry: where it applies and how it adjusts the limit and thresholds.
+
+    A rule applies when every criterion it sets matches: Routes (the BlockID
+    starts with the route number), Blocks (inclusive [first, last] ranges),
+    Symbols (case-insensitive fragments of the train symbol) and LimitEquals.
+    The effective limit becomes the posted limit plus LimitOffset; AlertSpeed
+    and OverSpeed, when set, replace the global values for that train.
+    """
+    __slots__ = ("name", "routes", "blocks", "symbols", "limit_equals", "limit_offset", "alert_speed", "over_speed")
+
+    def __init__(self, entry):
+        self.name = str(entry.get("Name", ""))
+        self.routes = [int(r) for r in entry.get("Routes", [])]
+        self.blocks = [(int(first), int(last)) for first, last in entry.get("Blocks", [])]
+        self.symbols = [s.strip().upper() for s in entry.get("Symbols", []) if s.strip()]
+        self.limit_equals = float(entry["LimitEquals"]) if "LimitEquals" in entry else None
+        self.limit_offset = float(entry.get("LimitOffset", 0))
+        self.alert_speed = float(entry["AlertSpeed"]) if "AlertSpeed" in entry else None
+        self.over_speed = float(entry["OverSpeed"]) if "OverSpeed" in entry else None
+
+
+class SymbolMatcher:
+    """Aho-Corasick automaton over symbol fragments; match() ORs the rule bits of every fragment found."""
+
+    def __init__(self, fragments):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [0]
+        for fragment, bit in fragments:
+            node = 0
+            for ch in fragment:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(0)
+                node = nxt
+            self._out[node] |= bit
+
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for ch, nxt in self._goto[node].items():
+                pending.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def match(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        node = mask = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            mask |= out[node]
+        return mask
+
+
+class SpeedRuleSet:
+    """SpeedRules compiled into indexes keyed by route, block range and symbol.
+
+    Rule i owns bit i. candidates() returns the rules whose route, block and
+    symbol criteria all match as a bitmask; select() then applies LimitEquals
+    and picks the first rule in file order.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        all_bits = (1 << len(rules)) - 1
+        self._route_index = {}
+        self._route_free = all_bits
+        self._block_free = all_bits
+        self._symbol_free = all_bits
+        boundaries = set()
+        fragments = []
+        for i, rule in enumerate(rules):
+            bit = 1 << i
+            if rule.routes:
+                self._route_free &= ~bit
+                for route in rule.routes:
+                    self._route_index[route] = self._route_index.get(route, 0) | bit
+            if rule.blocks:
+                self._block_free &= ~bit
+                for first, last in rule.blocks:
+                    boundaries.update((first, last + 1))
+            if rule.symbols:
+                self._symbol_free &= ~bit
+                fragments.extend((fragment, bit) for fragment in rule.symbols)
+
+        # Integer range map: segment k covers [points[k], points[k + 1]).
+        self._block_points = sorted(boundaries)
+        self._block_masks = []
+        for point in self._block_points:
+            mask = 0
+            for i, rule in enumerate(rules):
+                if any(first <= point <= last for first, last in rule.blocks):
+                    mask |= 1 << i
+            self._block_masks.append(mask)
+        self._symbols = SymbolMatcher(fragments)
+
+    def candidates(self, symbol, block):
+        route_mask = self._route_free
+        prefix = block
+        while prefix > 0:
+            route_mask |= self._route_index.get(prefix, 0)
+            prefix //= 10
+
+        block_mask = self._block_free
+        k = bisect.bisect_right(self._block_points, block) - 1
+        if k >= 0:
+            block_mask |= self._block_masks[k]
+
+        mask = route_mask & block_mask
+        if mask & ~self._symbol_free:
+            mask &= self._symbol_free | self._symbols.match(symbol.upper())
+        return mask
+
+    def select(self, mask, limit):
+        while mask:
+            low = mask & -mask
+            rule = self.rules[low.bit_length() - 1]
+            if rule.limit_equals is None or rule.limit_equals == limit:
+                return rule
+            mask ^= low
+        return None
+
+
+def compile_speed_rules(data):
+    """Build the rule set from SpeedRules, or from the older SuperC/Trona settings when it is absent."""
+    if "SpeedRules" in data:
+        entries = data["SpeedRules"]
+    else:
+        entries = [
+            {"Name": "SuperC", "Symbols": data["SuperCTrainSymbols"].split(","),
+             "LimitOffset": data["SuperCAlertSpeed"]},
+            {"Name": "Trona", "Routes": [data["TronaRouteID"]], "LimitEquals": 25,
+             "LimitOffset": data["TronaAlertSpeed"]},
+        ]
+    return SpeedRuleSet([SpeedRule(entry) for entry in entries])
+
+
+def speed_rule_for(server, snap, state):
+    """The SpeedRule for this train, re-evaluated only when its symbol or block changes."""
+    key = (snap.TrainSymbol, snap.BlockID)
+    if state.rule_key != key:
+        state.rule_key = key
+        state.rule_mask = server.speed_rules.candidates(snap.TrainSymbol, snap.BlockID)
+    if not state.rule_mask:
+        return None
+    return server.speed_rules.select(state.rule_mask, snap.TrainSpeedLimitMPH)
 
 
 # =========================================================
 # TRAIN / RADIO / SPEEDING
 # =========================================================
-def send_zero_speed_limit_radio_if_needed(train):
-    global zero_limit_pending, zero_limit_announced
-    if not mRun8:
-        return
-    
-    try:
-        limit = int(train.TrainSpeedLimitMPH)
-    except Exception:
-        limit = 0
-    hp_per_ton = float(train.HpPerTon)
-    train_id = int(getattr(train, "TrainID", 0))
-    now = time.time()
+def send_zero_speed_limit_radio_if_needed(server, snap, state, now):
+    limit = int(snap.TrainSpeedLimitMPH)
+    hp_per_ton = snap.HpPerTon
 
     if hp_per_ton <= 0 or limit != 0:
-        zero_limit_pending.pop(train_id, None)
-        zero_limit_announced.discard(train_id)
-        return
-
-    first_seen = zero_limit_pending.get(train_id)
-    if first_seen is None:
-        zero_limit_pending[train_id] = now
+        state.zero_limit_pending = None
+        state.zero_limit_announced = False
         return
 
-    if (now - first_seen) < 3.0 or train_id in zero_limit_announced:
+    if state.zero_limit_pending is None:
+        if not state.zero_limit_announced:
+            state.zero_limit_pending = now
+            server.deadlines.schedule(now + ZERO_LIMIT_CONFIRMATION_SECONDS, confirm_zero_limit, state)
+        return
+    confirm_zero_limit(server, state, now)
+
+
+def confirm_zero_limit(server, state, now):
+    """Deadline (and per-event check): the limit has read 0 MPH long enough, radio the engineer."""
+    first_seen = state.zero_limit_pending
+    if first_seen is None or state.zero_limit_announced or (now - first_seen) < ZERO_LIMIT_CONFIRMATION_SECONDS:
         return
 
-    zero_limit_pending.pop(train_id, None)
-    notice_template = messages.get("AutomatedNoticeMsg")
-    zero_template = messages.get("ZeroLimitMsg")
-
-    if notice_template:
-        notice_msg = notice_template.format(train=train)
-        if notice_msg:
-            mRun8.SendRadioText(DISPATCHER_RADIO_CHANNEL, notice_msg)
-
-    if zero_template:
-        zero_msg = zero_template.format(train=train)
-        if zero_msg:
-            mRun8.SendRadioText(DISPATCHER_RADIO_CHANNEL, zero_msg)
+    state.zero_limit_pending = None
+    state.zero_limit_announced = True
+    radio_zero_limit(server, state.last_snap)
 
-    zero_limit_announced.add(train_id)
 
-
-def handle_speeding(train, train_id, sim_now):
-    current = float(train.TrainSpeedMph)
-    limit = float(train.TrainSpeedLimitMPH)
+def handle_speeding(server, snap, state, sim_now, now):
+    train_id = state.train_id
+    current = snap.TrainSpeedMph
+    limit = snap.TrainSpeedLimitMPH
     cur_abs, lim_abs = abs(current), abs(limit)
-    effective_limit = lim_abs
-    sym = str(train.TrainSymbol).upper()
-    blk = int(train.BlockID)
-    is_super = any(s in sym for s in [x.strip().upper() for x in superc_train_symbols.split(",")])
-    is_trona = str(blk).startswith(str(trona_route_id)) and limit == 25.0
-
-    if is_super:
-        effective_limit = superc_alert_speed + limit
-    elif is_trona:
-        effective_limit = trona_alert_speed + limit
-
-    was_speeding = train_id in speeding_start
-    above_alert = cur_abs > (effective_limit + alert_speed)
-    above_over = cur_abs > (effective_limit + over_speed)
-    stop_speeding = was_speeding and cur_abs < (effective_limit + alert_speed - 1.0)
+    rule = speed_rule_for(server, snap, state)
+    if rule is None:
+        effective_limit, alert, over = lim_abs, server.alert_speed, server.over_speed
+    else:
+        effective_limit = rule.limit_offset + limit
+        alert = server.alert_speed if rule.alert_speed is None else rule.alert_speed
+        over = server.over_speed if rule.over_speed is None else rule.over_speed
+
+    was_speeding = state.speeding_start is not None
+    above_alert = cur_abs > (effective_limit + alert)
+    above_over = cur_abs > (effective_limit + over)
+    stop_speeding = was_speeding and cur_abs < (effective_limit + alert - 1.0)
 
     # Speeding start
     if above_alert:
-        if train_id not in speed_exceed_start:
-            speed_exceed_start[train_id] = sim_now
-
-        if (not was_speeding) and (sim_now.Subtract(speed_exceed_start[train_id]).TotalSeconds >= SPEED_CONFIRMATION_SECONDS):
-            speeding_start[train_id] = sim_now
-            max_overspeed[train_id] = 0.0
-            msg = format_msg(
-                "SpeedingStartMsg",
-                sim_now=sim_now,
-                train=train,
-                train_id=train_id,
-                current=current,
-                limit=limit,
-                block=train.BlockID
-            )
-            print(msg)
-            if discord_enabled and discord_status_channel:
-                discord_send(discord_status_channel, msg)
+        if state.speed_exceed_start is None:
+            state.speed_exceed_start = now
+            server.deadlines.schedule(now + SPEED_CONFIRMATION_SECONDS, confirm_speeding, state)
+        elif not was_speeding:
+            confirm_speeding(server, state, now)
 
-        if was_speeding and train_id in max_overspeed:
+        if was_speeding:
             over_now = cur_abs - lim_abs
-            if over_now > max_overspeed[train_id]:
-                max_overspeed[train_id] = over_now
+            if over_now > state.max_overspeed:
+                state.max_overspeed = over_now
 
-        if above_over and train_id not in overspeed_warned:
-            msg = format_msg(
+        if above_over and not state.overspeed_warned:
+            msg = server.msg(
                 "OvrSpeedBanMsg",
-                sim_now=sim_now, train=train, train_id=train_id,
-                current=current, limit=limit, block=train.BlockID,
+                sim_now=sim_now, train=snap, train_id=train_id,
+                current=current, limit=limit, block=snap.BlockID,
                 over=(cur_abs - lim_abs)
             )
-            print(msg)
-            if discord_enabled:
-                if discord_alert_role != 0 and discord_alert_channel:
-                    if discord_status_channel:
-                        discord_send(discord_status_channel, msg)
-                    msg = "<@&" + str(discord_alert_role) + "> - " + msg
-                    discord_send(discord_alert_channel, msg)
+            server.emit(msg)
+            log_history(server, "overspeed_ban", snap, train_id, sim_now, amount=cur_abs - lim_abs)
+            server.speed_stats.overspeed_ban(snap.EngineerName, snap.BlockID, now)
+            if discord_enabled and server.alert_storms.admit(snap, train_id, now):
+                if server.discord_alert_role != 0 and server.discord_alert_channel and server.alert_storms.ping(now):
+                    if server.discord_status_channel:
+                        discord_send(server.discord_status_channel, msg)
+                    msg = "<@&" + str(server.discord_alert_role) + "> - " + msg
+                    discord_send(server.discord_alert_channel, msg)
                 else:
-                    discord_broadcast_alert(msg)
-            overspeed_warned.add(train_id)
-
-        if was_speeding and train_id not in sustained_warned:
-            dur = sim_now.Subtract(speeding_start[train_id]).TotalSeconds
-            if dur > alert_speed_timer:
-                msg = format_msg(
-                    "SustSpeedBanMsg",
-                    sim_now=sim_now, train=train, train_id=train_id,
-                    current=current, limit=limit, block=train.BlockID,
-                    minutes=alert_speed_timer / 60.0
-                )
-                print(msg)
-                discord_broadcast_alert(msg)
-                sustained_warned.add(train_id)
+                    discord_broadcast_alert(server, msg)
+            state.overspeed_warned = True
+
+        if was_speeding:
+            check_sustained_speeding(server, state, now)
     else:
-        if train_id in speed_exceed_start:
-            del speed_exceed_start[train_id]
+        state.speed_exceed_start = None
         if stop_speeding:
-            start = speeding_start[train_id]
-            dur = sim_now.Subtract(start).TotalSeconds
-            max_over = max_overspeed.get(train_id, 0.0)
-            msg = format_msg(
+            dur = now - state.speeding_start
+            max_over = state.max_overspeed
+            msg = server.msg(
                 "SpeedingEndMsg",
                 sim_now=sim_now,
-                train=train,
+                train=snap,
                 train_id=train_id,
                 duration=dur / 60.0,
                 max_over=max_over,
-                block=train.BlockID
+                block=snap.BlockID
             )
-            print(msg)
-            if discord_enabled:
-                if discord_status_channel:
-                    discord_send(discord_status_channel, msg)
-                if discord_alert_channel and (train_id in overspeed_warned or train_id in sustained_warned):
-                    discord_send(discord_alert_channel, msg)
-            speeding_start.pop(train_id, None)
-            max_overspeed.pop(train_id, None)
-            overspeed_warned.discard(train_id)
-            sustained_warned.discard(train_id)
+            server.emit(msg)
+            log_history(server, "speeding_end", snap, train_id, sim_now, amount=dur / 60.0, peak=max_over)
+            server.speed_stats.speeding_ended(snap.EngineerName, snap.BlockID, now, dur, max_over)
+            if discord_enabled and server.alert_storms.admit(snap, train_id, now, counts=False):
+                if server.discord_status_channel:
+                    discord_send(server.discord_status_channel, msg)
+                if server.discord_alert_channel and (state.overspeed_warned or state.sustained_warned):
+                    discord_send(server.discord_alert_channel, msg)
+            state.speeding_start = None
+            state.max_overspeed = 0.0
+            state.overspeed_warned = False
+            state.sustained_warned = False
+
+
+def confirm_speeding(server, state, now):
+    """Deadline (and per-event check): the train has stayed above the alert speed for the confirmation window."""
+    start = state.speed_exceed_start
+    if state.speeding_start is not None or start is None or now - start < SPEED_CONFIRMATION_SECONDS:
+        return
+
+    snap = state.last_snap
+    state.speeding_start = now
+    state.max_overspeed = 0.0
+    server.deadlines.schedule(now + server.alert_speed_timer, check_sustained_speeding, state)
+    msg = server.msg(
+        "SpeedingStartMsg",
+        sim_now=server.last_sim_time,
+        train=snap,
+        train_id=state.train_id,
+        current=snap.TrainSpeedMph,
+        limit=snap.TrainSpeedLimitMPH,
+        block=snap.BlockID
+    )
+    server.emit(msg)
+    log_history(server, "speeding_start", snap, state.train_id, server.last_sim_time)
+    server.speed_stats.speeding_started(snap.EngineerName, snap.BlockID, now)
+    if discord_enabled and server.discord_status_channel and server.alert_storms.admit(snap, state.train_id, now):
+        discord_send(server.discord_status_channel, msg)
+
+
+def check_sustained_speeding(server, state, now):
+    """Deadline (and per-event check): speeding for longer than AlertSpeedTimer while above the alert speed."""
+    if state.speeding_start is None or state.sustained_warned or state.speed_exceed_start is None:
+        return
+    if now - state.speeding_start <= server.alert_speed_timer:
+        return
+
+    snap = state.last_snap
+    msg = server.msg(
+        "SustSpeedBanMsg",
+        sim_now=server.last_sim_time, train=snap, train_id=state.train_id,
+        current=snap.TrainSpeedMph, limit=snap.TrainSpeedLimitMPH, block=snap.BlockID,
+        minutes=server.alert_speed_timer / 60.0
+    )
+    server.emit(msg)
+    log_history(server, "sustained_ban", snap, state.train_id, server.last_sim_time,
+                amount=(now - state.speeding_start) / 60.0)
+    if discord_enabled and server.alert_storms.admit(snap, state.train_id, now):
+        discord_broadcast_alert(server, msg)
+    state.sustained_warned = True
 
 
 # =========================================================
 # COUPLING DETECTION
 # =========================================================
-def handle_coupling(train, train_id, sim_now):
-    current_axles = int(train.AxleCount)
-
-    # Initialize if first observation
-    if train_id not in last_axle_count:
-        last_axle_count[train_id] = current_axles
-        prev_speed_snapshot[train_id] = abs(float(train.TrainSpeedMph))
+def handle_coupling(server, snap, state, sim_now, now):
+    """Compare this update with the newest sample in state.history, which it is appended to afterwards."""
+    history = state.history
+    current_axles = snap.AxleCount
+
+    # Nothing to compare on the first observation
+    previous = history.sample()
+    if previous is None:
         return
-
-    previous_axles = last_axle_count[train_id]
-    previous_speed = abs(float(prev_speed_snapshot.get(train_id, train.TrainSpeedMph)))
+    _, previous_speed, _, previous_axles = previous
 
     # Skip if axle count unchanged
     if current_axles == previous_axles:
-        prev_speed_snapshot[train_id] = abs(float(train.TrainSpeedMph))
         return
 
     # Axle decrease → block next 5 seconds
     if current_axles < previous_axles:
-        axle_increase_blocked_until[train_id] = sim_now.AddSeconds(AXLE_BLOCK_DURATION_SECONDS)
-        last_axle_count[train_id] = current_axles
-        prev_speed_snapshot[train_id] = abs(float(train.TrainSpeedMph))
+        block_axle_increase(server, state, now)
         return
 
     # If blocked, ignore
-    if train_id in axle_increase_blocked_until:
-        blocked_until = axle_increase_blocked_until[train_id]
-        if sim_now.Subtract(blocked_until).TotalSeconds < 0:
-            last_axle_count[train_id] = current_axles
-            prev_speed_snapshot[train_id] = abs(float(train.TrainSpeedMph))
-            return
-        else:
-            axle_increase_blocked_until.pop(train_id, None)
+    if state.axle_blocked_until is not None and now < state.axle_blocked_until:
+        return
 
-    # Coupling detected (axle increase)
+    # Coupling detected (axle increase); the window does not hold this update yet, so it is the approach
     if current_axles > previous_axles:
-        axle_increase_blocked_until[train_id] = sim_now.AddSeconds(AXLE_BLOCK_DURATION_SECONDS)
-        msg = format_msg(
+        block_axle_increase(server, state, now)
+        rate = history.window_rate()
+        msg = server.msg(
             "CoupledMsg",
             sim_now=sim_now,
-            train=train,
+            train=snap,
             prev_axles=previous_axles,
             curr_axles=current_axles,
-            speed=previous_speed
+            speed=previous_speed,
+            approach_max=history.window_max(),
+            approach_decel=-rate if rate is not None else 0.0
         )
+        hard = previous_speed > server.hard_couple_speed
+        log_history(server, "hard_coupled" if hard else "coupled", snap, state.train_id, sim_now,
+                    amount=previous_speed)
+        server.speed_stats.coupled(snap.EngineerName, snap.BlockID, now, previous_speed, hard)
         if msg:
-            print(msg)
+            server.emit(msg)
             if discord_enabled:
-                if discord_status_channel and verbose_logging:
-                    discord_send(discord_status_channel, msg)
-                if previous_speed > hard_couple_speed:
-                    if discord_alert_channel:
-                        discord_send(discord_alert_channel, msg)
+                if server.discord_status_channel and verbose_logging:
+                    discord_send(server.discord_status_channel, msg)
+                if hard:
+                    if server.discord_alert_channel:
+                        discord_send(server.discord_alert_channel, msg)
                     if not verbose_logging:
-                        discord_send(discord_status_channel, msg)
-
-    # Update tracking
-    last_axle_count[train_id] = current_axles
-    prev_speed_snapshot[train_id] = abs(float(train.TrainSpeedMph))
+                        discord_send(server.discord_status_channel, msg)
 
 
+def block_axle_increase(server, state, now):
+    state.axle_blocked_until = now + AXLE_BLOCK_DURATION_SECONDS
+    server.deadlines.schedule(state.axle_blocked_until, clear_axle_block, state)
 
 
+def clear_axle_block(server, state, now):
+    """Deadline: drop the expired axle block."""
+    if state.axle_blocked_until is not None and state.axle_blocked_until < now:
+        state.axle_blocked_until = None
 
 
 # =========================================================
 # TRAIN DATA HANDLER
 # =========================================================
-def on_train_data(sender, e):
-    global last_data_received_ts, data_timeout_announced
+class TrainUpdate:
+    """One TrainData event as queued for the detection worker; `profile` is its R8Profile.Sample, if sampled."""
+    __slots__ = ("train_id", "engineer_type", "snap", "sim_now", "now", "profile")
+
+    def __init__(self, train_id, engineer_type, snap, sim_now, now):
+        self.train_id = train_id
+        self.engineer_type = engineer_type
+        self.snap = snap
+        self.sim_now = sim_now
+        self.now = now
+        self.profile = None
+
+    def can_absorb(self, newer):
+        """A newer update may replace this one unless it carries a transition the detectors must see."""
+        if newer.engineer_type != self.engineer_type:
+            return False
+        if self.snap is None or newer.snap is None:
+            return self.snap is None and newer.snap is None
+        return newer.snap.AxleCount == self.snap.AxleCount
+
+    def absorb(self, newer):
+        self.snap = newer.snap
+        self.sim_now = newer.sim_now
+        self.now = newer.now
+        if newer.profile is not None:
+            self.profile = newer.profile
+
+
+def on_train_data(server, sender, e):
+    """DispatcherComms callback: snapshot the event and hand it to the server's detection worker."""
+    server.last_data_received_ts = time.time()
+    server.data_timeout_announced = False
+    sim_now = server.last_sim_time
+    now = server.last_sim_seconds
+    sample = profiler.start(server.name, sim_now) if profiler is not None and sim_now is not None else None
+
+    # Trains that are not and were not player trains only need their ID and engineer type.
     train = e.Train
     train_id = int(train.TrainID)
-    last_data_received_ts = time.time()
-    data_timeout_announced = False
-    sim_now = last_sim_time
+    player_type = int(EEngineerType.Player)
+    current_engineer_type = int(train.EngineerType)
+    if metrics is not None:
+        metrics.events.add((server.name, train_id))
+    state = server.trains.get(train_id)
+    snap = None
+    if current_engineer_type == player_type or (state is not None and state.engineer_type == player_type):
+        snap = TrainSnapshot(train, train_id, current_engineer_type)
+
+    update = TrainUpdate(train_id, current_engineer_type, snap, sim_now, now)
     if sim_now is None:
+        # No sim clock yet, as right after the server starts; on_simulation_state replays these.
+        server.early_updates.append(update)
         return
-
-    with lock_obj:
-        announce_startup_complete()
-        current_engineer_type = int(train.EngineerType)
-        previous_engineer_type = last_engineer_type.get(train_id, current_engineer_type)
-
-        if previous_engineer_type == int(EEngineerType.Player) and current_engineer_type != int(EEngineerType.Player):
-            msg = format_msg("RelinquishMsg", sim_now=sim_now, train=train)
-            print(msg)
-            if discord_enabled and discord_status_channel and verbose_logging:
-                discord_send(discord_status_channel, msg)
-            for d in [active_players, speeding_start, max_overspeed, last_axle_count, last_speed,
-                      axle_increase_blocked_until, last_player_name, last_train_symbol, speed_exceed_start,
-                      zero_limit_pending]:
-                d.pop(train_id, None)
-            overspeed_warned.discard(train_id)
-            sustained_warned.discard(train_id)
-            zero_limit_announced.discard(train_id)
-
-        if current_engineer_type == int(EEngineerType.Player):
-            last_player_name[train_id] = str(train.EngineerName)
-            last_train_symbol[train_id] = str(train.TrainSymbol)
-            current_speed = float(train.TrainSpeedMph)
-            last_speed[train_id] = current_speed
-
-            if train_id not in active_players:
-                active_players[train_id] = sim_now
-                msg = format_msg("TookControlMsg", sim_now=sim_now, train=train)
-                print(msg)
-                if discord_enabled and discord_status_channel and verbose_logging:
-                    discord_send(discord_status_channel, msg)
+    if sample is not None:
+        sample.train_id = train_id
+        update.profile = sample
+    dispatch_update(server, update)
+
+
+def dispatch_update(server, update):
+    """Record an update and hand it to the server's detection worker, or process it inline without one."""
+    sample = update.profile
+    if server.recorder is not None:
+        if sample is not None:
+            sample.switch("record")
+        server.recorder.record(update.now, update.train_id, update.engineer_type, update.snap)
+    if sample is not None:
+        sample.switch("queue")
+    if server.ingest_queue is None:
+        process_train_update(server, update)
+    else:
+        server.ingest_queue.put(update)
+
+
+def replay_early_updates(server):
+    """Hand on TrainData held back until the sim clock was known, stamped with the clock's first reading."""
+    early = server.early_updates
+    while early:
+        update = early.popleft()
+        update.sim_now = server.last_sim_time
+        update.now = server.last_sim_seconds
+        dispatch_update(server, update)
+        server.early_replayed += 1
+
+
+def process_train_update(server, update):
+    """Run the detectors for one queued TrainData event."""
+    trains = server.trains
+    train_id = update.train_id
+    current_engineer_type = update.engineer_type
+    snap = update.snap
+    sim_now = update.sim_now
+    now = update.now
+    player_type = int(EEngineerType.Player)
+
+    with server.lock:
+        # A coalesced update keeps its place in line but carries the newer update's time, which can be later
+        # than that of updates queued behind it; never let the detectors see the sim clock go backwards.
+        if now < server.last_processed_now:
+            now = server.last_processed_now
+        else:
+            server.last_processed_now = now
+        announce_startup_complete(server)
+        server.deadlines.run_due(now)
+        trains.expire(now)
+        server.alert_storms.expire(now)
+        state = trains.touch(train_id, current_engineer_type, now)
+        server.updates_processed += 1
+        fingerprint = None
+        if snap is not None:
+            fingerprint = snapshot_fingerprint(snap)
+            if fingerprint == state.fingerprint and current_engineer_type == state.engineer_type:
+                state.last_seen = now
+                # Still a sample: the speed windows are over sim time, and a steady approach is part of them.
+                state.history.append(now, abs(snap.TrainSpeedMph), snap.TrainSpeedLimitMPH, snap.AxleCount)
+                server.updates_unchanged += 1
+                return
+
+        state = handle_control_change(server, snap, state, current_engineer_type, sim_now, now)
+
+        if current_engineer_type == player_type:
+            state.player_name = snap.EngineerName
+            state.train_symbol = snap.TrainSymbol
+            state.last_speed = snap.TrainSpeedMph
+            state.last_snap = snap
+            state.last_seen = now
+            history = state.history
+            if history is None:
+                history = state.history = R8Stats.SpeedHistory()
+
+            send_zero_speed_limit_radio_if_needed(server, snap, state, now)
+            handle_speeding(server, snap, state, sim_now, now)
+            handle_coupling(server, snap, state, sim_now, now)
+            history.append(now, abs(snap.TrainSpeedMph), snap.TrainSpeedLimitMPH, snap.AxleCount)
+
+            if (state.speed_exceed_start is None or state.sustained_warned) and state.zero_limit_pending is None:
+                state.fingerprint = fingerprint
             else:
-                active_players[train_id] = sim_now
-
-            send_zero_speed_limit_radio_if_needed(train)
-            handle_speeding(train, train_id, sim_now)
-            handle_coupling(train, train_id, sim_now)
-            last_speed[train_id] = current_speed
+                state.fingerprint = None
+
+        state.engineer_type = current_engineer_type
+
+
+def handle_control_change(server, snap, state, engineer_type, sim_now, now):
+    """Announce a player giving up or taking control of a train. Returns the train's state, reset after a hand-off."""
+    player_type = int(EEngineerType.Player)
+    train_id = state.train_id
+    if state.engineer_type == player_type and engineer_type != player_type:
+        msg = server.msg("RelinquishMsg", sim_now=sim_now, train=snap or state.last_snap)
+        server.emit(msg)
+        log_history(server, "relinquished", snap or state.last_snap, train_id, sim_now)
+        if discord_enabled and server.discord_status_channel and verbose_logging:
+            discord_send(server.discord_status_channel, msg)
+        state = server.trains.reset(state)
+
+    if engineer_type == player_type and state.last_seen is None:
+        msg = server.msg("TookControlMsg", sim_now=sim_now, train=snap)
+        server.emit(msg)
+        log_history(server, "took_control", snap, train_id, sim_now)
+        if discord_enabled and server.discord_status_channel and verbose_logging:
+            discord_send(server.discord_status_channel, msg)
+        server.deadlines.schedule(now + PLAYER_TIMEOUT_SECONDS, check_player_timeout, state)
+    return state
+
+
+def check_player_timeout(server, state, now):
+    """Deadline: time the player train out, or re-arm if it has reported since."""
+    if state.last_seen is None:
+        return
+    expires = state.last_seen + PLAYER_TIMEOUT_SECONDS
+    if now <= expires:
+        server.deadlines.schedule(expires, check_player_timeout, state)
+        return
 
-        last_engineer_type[train_id] = current_engineer_type
+    msg = server.msg("TrainTimeoutMsg", sim_now=server.last_sim_time, train_id=state.train_id)
+    server.emit(msg)
+    log_history(server, "timeout", state.last_snap, state.train_id, server.last_sim_time)
+    if discord_enabled and server.discord_status_channel and verbose_logging:
+        discord_send(server.discord_status_channel, msg)
+    server.trains.reset(state)
 
 
 # =========================================================
 # MONITOR THREAD
 # =========================================================
 def monitor_player_trains():
-    import System
-    global last_data_received_ts, data_timeout_announced
-    periodic_announce_counter = periodic_announce_time
+    periodic_announce_counters = {server: server.periodic_announce_time for server in servers}
     periodic_announce_msg = messages.get("PeriodicAnnounceMsg")
-    notice_msg = messages.get("AutomatedNoticeMsg")
+    stats_digest_counter = 0
+    metrics_summary_counter = 0
     while True:
         time.sleep(1)
-        now = time.time()
-        if periodic_announce_counter == periodic_announce_time and periodic_announce_time != 0:
-            mRun8.SendRadioText(DISPATCHER_RADIO_CHANNEL, notice_msg)
-            mRun8.SendRadioText(DISPATCHER_RADIO_CHANNEL, periodic_announce_msg)
-            periodic_announce_counter = 1
-        if periodic_announce_time != 0:
-            periodic_announce_counter += 1
-        if last_data_received_ts is not None and (now - last_data_received_ts) > 5:
-            if not data_timeout_announced:
-                emit_disconnected_message()
-
-        if last_sim_time is None:
-            continue
+        for server in servers:
+            periodic_announce_time = server.periodic_announce_time
+            if periodic_announce_counters[server] == periodic_announce_time and periodic_announce_time != 0:
+                radio_notice(server, periodic_announce_msg, dedupe=False)
+                periodic_announce_counters[server] = 1
+            if periodic_announce_time != 0:
+                periodic_announce_counters[server] += 1
+        if stats_digest_time != 0:
+            stats_digest_counter += 1
+            if stats_digest_counter >= stats_digest_time:
+                for server in servers:
+                    publish_stats_digest(server)
+                stats_digest_counter = 0
+        if metrics_summary_time != 0 and metrics is not None:
+            metrics_summary_counter += 1
+            if metrics_summary_counter >= metrics_summary_time:
+                emit(metrics_summary())
+                metrics_summary_counter = 0
+        monitor_tick()
+
+
+def publish_stats_digest(server):
+    """Post a server's running speeding/coupling statistics to the console and its status channel."""
+    with server.lock:
+        digest = server.speed_stats.digest(server.last_sim_seconds or 0.0)
+    if not digest:
+        return
+    digest = server.prefix + digest
+    server.emit(digest)
+    if discord_enabled and server.discord_status_channel:
+        discord_send(server.discord_status_channel, digest)
 
-        sim_now = last_sim_time
-        stale = []
-        for tid, ts in list(active_players.items()):
-            try:
-                if sim_now.Subtract(ts).TotalSeconds > 5:
-                    stale.append(tid)
-            except Exception:
-                continue
 
-        for tid in stale:
-            msg = format_msg("TrainTimeoutMsg", sim_now=sim_now, train_id=tid)
-            print(msg)
-            if discord_enabled and discord_status_channel and verbose_logging:
-                discord_send(discord_status_channel, msg)
-            for d in [active_players, speeding_start, max_overspeed, last_axle_count, last_speed,
-                      axle_increase_blocked_until, last_player_name, last_train_symbol, speed_exceed_start,
-                      zero_limit_pending]:
-                d.pop(tid, None)
-            overspeed_warned.discard(tid)
-            sustained_warned.discard(tid)
-            zero_limit_announced.discard(tid)
+def stats_summary(engineer=None, block=None, server=None):
+    """Current statistics as a dict: overall, or for one engineer name or BlockID (None if unknown).
+
+    `server` defaults to the first monitored server.
+    """
+    server = server or servers[0]
+    now = server.last_sim_seconds or 0.0
+    with server.lock:
+        if engineer is not None:
+            return server.speed_stats.engineer(engineer, now)
+        if block is not None:
+            return server.speed_stats.block(block, now)
+        return server.speed_stats.summary(now)
+
+
+def monitor_tick():
+    """One pass of the monitor loop: announce a disconnect for each server whose TrainData has stopped.
+
+    Train deadlines and state expiry run on the detection workers, in order
+    with the events they depend on.
+    """
+    for server in servers:
+        last_data_received_ts = server.last_data_received_ts
+        if last_data_received_ts is not None and (time.time() - last_data_received_ts) > 5:
+            if not server.data_timeout_announced:
+                emit_disconnected_message(server)
+
+
+# =========================================================
+# METRICS
+# =========================================================
+def start_metrics():
+    """Time the hot paths and serve /metrics on MetricsPort (see R8Metrics.py).
+
+    Does nothing unless MetricsPort or MetricsSummaryTimer is set, so the
+    handlers run uninstrumented by default. The server locks are timed from
+    the start: load_settings creates `metrics` before it builds the servers.
+    """
+    if metrics is None:
+        return
+    module = globals()
+    for name in METRICS_CALLS:
+        module[name] = metrics.timed(name, module[name])
+    if metrics_port:
+        host, port = metrics.serve(metrics_port, metrics_gauges)
+        emit(f"[Speeder] Serving metrics on http://{host}:{port}/metrics")
+
+
+def metrics_gauges():
+    """Current gauge and counter samples for the /metrics endpoint."""
+    import R8Metrics
+    rates = metrics.events.roll()
+    per_server = {}
+    for (name, _), rate in rates.items():
+        per_server[name] = per_server.get(name, 0.0) + rate
+    busiest = heapq.nlargest(R8Metrics.TOP_TRAINS, rates.items(), key=lambda item: item[1])
+    top = [({"server": name, "train_id": train_id}, rate) for (name, train_id), rate in busiest]
+    players, events, sizes, updates, unchanged = [], [], [], [], []
+    player_type = int(EEngineerType.Player) if EEngineerType is not None else None
+    for server in servers:
+        label = {"server": server.name}
+        with server.lock:
+            active = sum(1 for state in server.trains.values()
+                         if state.engineer_type == player_type and state.last_seen is not None)
+            storms = server.alert_storms.stats()
+            store_sizes = {"trains": len(server.trains), "deadlines": len(server.deadlines),
+                           "alert_blocks": storms["blocks"], "alert_storms": storms["active"],
+                           "stats_engineers": len(server.speed_stats.engineers),
+                           "stats_blocks": len(server.speed_stats.blocks)}
+        if server.ingest_queue is not None:
+            store_sizes["ingest_queue"] = len(server.ingest_queue)
+        if server.radio_sender is not None:
+            store_sizes["radio_pending"] = server.radio_sender.stats()["pending"]
+        players.append((label, active))
+        events.append((label, per_server.get(server.name, 0.0)))
+        sizes += [({"server": server.name, "store": store}, size) for store, size in store_sizes.items()]
+        updates.append((label, server.updates_processed))
+        unchanged.append((label, server.updates_unchanged))
+    shared = {"output_queue": len(output_stage) if output_stage is not None else 0}
+    if log_sink is not None:
+        shared["log_buffer"] = log_sink.stats()["buffered"]
+    if history is not None:
+        shared["history_buffer"] = history.stats()["buffered"]
+    if discord_dispatcher is not None:
+        shared["discord_backlog"] = discord_dispatcher.stats()["backlog"]
+    sizes += [({"server": "", "store": store}, size) for store, size in shared.items()]
+    return [
+        ("r8speeder_active_players", "Player trains currently reporting.", "gauge", players),
+        ("r8speeder_events_per_second", "TrainData events per second over the last rate window.", "gauge", events),
+        ("r8speeder_train_events_per_second", "TrainData events per second of the busiest trains.", "gauge", top),
+        ("r8speeder_store_size", "Entries held in each per-train store and queue.", "gauge", sizes),
+        ("r8speeder_updates_total", "TrainData updates processed.", "counter", updates),
+        ("r8speeder_updates_unchanged_total", "Updates skipped as unchanged.", "counter", unchanged),
+        ("r8speeder_log_dropped_total", "Console/log messages dropped because the buffer was full.", "counter",
+         [({}, log_sink.dropped if log_sink is not None else 0)]),
+    ]
+
+
+def metrics_summary():
+    """One console line with rates, latencies and queue sizes."""
+    import R8Metrics
+    gauges = {name: samples for name, _, _, samples in metrics_gauges()}
+    calls = metrics.calls
+    parts = [f"{sum(v for _, v in gauges['r8speeder_events_per_second']):.0f} events/s",
+             f"{sum(v for _, v in gauges['r8speeder_active_players']):.0f} players"]
+    for name in ("on_train_data", "process_train_update", "format_msg", "discord_send"):
+        if name in calls and calls[name].count:
+            parts.append(f"{name} p50 {R8Metrics.micros(calls[name].percentile(0.5))} "
+                         f"p99 {R8Metrics.micros(calls[name].percentile(0.99))}")
+    for server in servers:
+        wait, hold = metrics.lock_wait.get(server.name), metrics.lock_hold.get(server.name)
+        if wait is not None and wait.count:
+            parts.append(f"{server.prefix}lock wait p99 {R8Metrics.micros(wait.percentile(0.99))} "
+                         f"hold p99 {R8Metrics.micros(hold.percentile(0.99))}")
+    sizes = {labels["store"]: value for labels, value in gauges["r8speeder_store_size"] if not labels["server"]}
+    parts += [f"{store} {value:.0f}" for store, value in sizes.items()]
+    return "[Metrics] " + ", ".join(parts)
+
+
+# =========================================================
+# PROFILER
+# =========================================================
+def start_profiler():
+    """Sample 1 in ProfileSampleEvery TrainData events and time each phase (see R8Profile.py).
+
+    Does nothing unless ProfileSampleEvery (or --profile) is set.
+    """
+    global profiler
+    if not profile_sample_every:
+        return
+    import R8Profile
+    profiler = R8Profile.Profiler(profile_sample_every)
+    module = globals()
+    for name, phase in PROFILE_PHASES.items():
+        module[name] = profiler.phase(phase, module[name])
+    for name in PROFILE_OUTPUT_CALLS:
+        module[name] = profiler.phase(name, module[name], output=True)
+
+    process = module["process_train_update"]
+
+    def profiled_train_update(server, update):
+        sample = update.profile
+        if sample is None:
+            return process(server, update)
+        unchanged = server.updates_unchanged
+        sample.switch("process")
+        profiler.bind(sample)
+        try:
+            return process(server, update)
+        finally:
+            profiler.bind(None)
+            sample.unchanged = server.updates_unchanged != unchanged
+            profiler.finish(sample)
+
+    module["process_train_update"] = profiled_train_update
+    emit(f"[Speeder] Profiling 1 in {profiler.every} TrainData events")
+
+
+def write_profile():
+    """Write the profile to ProfileFile.folded and ProfileFile.txt, if profiling, and say where."""
+    if profiler is None:
+        return
+    folded, report = profiler.write(profile_file)
+    emit(f"[Speeder] Profile written to {folded} (flame graph stacks) and {report}")
+    # Called on the way out, so make sure the message is written before the process exits.
+    if log_sink is not None:
+        log_sink.flush(EXIT_FLUSH_SECONDS)
+
+
+# =========================================================
+# STARTUP
+# =========================================================
+class StartupClock:
+    """Seconds from launch to each startup milestone, for the startup timing report."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = {}
+        self.notes = []
+
+    def mark(self, name):
+        """Note when `name` was first reached; returns its seconds since launch."""
+        return self.marks.setdefault(name, time.perf_counter() - self.start)
+
+    def note(self, text):
+        self.notes.append(text)
+
+    def report(self):
+        steps = sorted(self.marks.items(), key=lambda item: item[1])
+        text = "[Speeder] Startup timing: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in steps)
+        return text + "".join(f"; {note}" for note in self.notes)
+
+
+def connect_servers():
+    """Create and start every server's proxy at once, so a slow or unreachable server does not hold up the rest."""
+
+    def connect(server):
+        try:
+            attach(server, Run8ProxyFactory.GetRun8Proxy())
+            port = server.port or DispatcherProxyFactory.DefaultExternalDispatcherPort
+            server.proxy.Start(server.host, port)
+            startup.mark(f"{server.prefix}proxy started")
+        except Exception as ex:
+            emit(f"{server.prefix}[Speeder] Could not start the proxy for {server.host}: {ex!r}")
+
+    threads = [threading.Thread(target=connect, args=(server,), daemon=True) for server in servers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
 
 
 # =========================================================
 # MAIN
 # =========================================================
 def main():
-    global mRun8
     print("=== R8Speeder (Python) ===")
     print("Attempting to connect to Run8 External Dispatcher Interface...")
     print("Press CTRL+C to exit at any time.\n")
 
+    global profile_sample_every, startup
+    startup = StartupClock()
+    parser = argparse.ArgumentParser(description="Watch a Run8 server for speeding and hard couplings.")
+    parser.add_argument("--profile", type=int, nargs="?", const=PROFILE_DEFAULT_EVERY, default=None, metavar="N",
+                        help=f"profile 1 in N TrainData events (default {PROFILE_DEFAULT_EVERY}) and write "
+                             f"ProfileFile.folded/.txt on exit")
+    args = parser.parse_args()
+
     load_settings()
-    load_dispatcher_comms()
+    if args.profile is not None:
+        profile_sample_every = args.profile
+    startup.mark("settings loaded")
+
+    # Loading the CLR, logging in to Discord and the rest of the setup overlap; only connecting
+    # waits for DispatcherComms.
+    dll_loader = threading.Thread(target=load_dispatcher_comms, daemon=True)
+    dll_loader.start()
     start_discord_in_thread()
-
-    mRun8 = Run8ProxyFactory.GetRun8Proxy()
-    mRun8.Connected += on_connected
-    mRun8.Disconnected += on_disconnected
-    mRun8.TrainData += on_train_data
-    mRun8.SimulationState += on_simulation_state
-    try:
-        mRun8.DispatcherPermission += on_dispatcher_permission
-    except Exception:
-        pass
-
-    port = DispatcherProxyFactory.DefaultExternalDispatcherPort
-    mRun8.Start("localhost", port)
+    start_pipeline()
+    start_history()
+    start_metrics()
+    start_profiler()
+    dll_loader.join()
+    if Run8ProxyFactory is None:
+        sys.exit(1)
+    start_recorder()
+    connect_servers()
 
     threading.Thread(target=monitor_player_trains, daemon=True).start()
 
@@ -589,7 +2361,12 @@ def main():
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        print("\nExiting...")
+        emit("\nExiting...")
+        for server in servers:
+            if server.recorder is not None:
+                server.recorder.close()
+        write_profile()
+        flush_on_exit()
 
 
 if __name__ == "__main__":
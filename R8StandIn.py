@@ -0,0 +1,338 @@
+"""
+Pure-Python stand-in for the Run8 DispatcherComms proxy.
+
+Exposes the same events R8Speeder subscribes to (TrainData, SimulationState,
+Connected, Disconnected, DispatcherPermission) plus SendRadioText, and drives
+them from a configurable fleet of fake trains so the bot can be exercised on
+any machine without Run8, Windows or pythonnet.
+"""
+import random
+import threading
+from datetime import datetime, timedelta
+
+
+# =========================================================
+# .NET LOOKALIKES
+# =========================================================
+class EEngineerType:
+    """Mirror of MessagesFromRun8.EEngineerType."""
+    Player = 0
+    AI = 1
+    Remote = 2
+    NoEngineer = 3
+
+
+class TimeSpan:
+    __slots__ = ("TotalSeconds",)
+
+    def __init__(self, seconds):
+        self.TotalSeconds = seconds
+
+
+class SimDateTime:
+    """Minimal System.DateTime: Ticks, Subtract, AddSeconds and a printable value."""
+    __slots__ = ("_dt",)
+
+    def __init__(self, dt):
+        self._dt = dt
+
+    @property
+    def Ticks(self):
+        delta = self._dt - datetime(1, 1, 1)
+        return (delta.days * 86400 + delta.seconds) * 10_000_000 + delta.microseconds * 10
+
+    def Subtract(self, other):
+        return TimeSpan((self._dt - other._dt).total_seconds())
+
+    def AddSeconds(self, seconds):
+        return SimDateTime(self._dt + timedelta(seconds=seconds))
+
+    def __str__(self):
+        return self._dt.strftime("%m/%d/%Y %I:%M:%S %p")
+
+
+class Event:
+    """Supports the `proxy.Event += handler` subscription syntax used with pythonnet."""
+
+    def __init__(self):
+        self._handlers = []
+
+    def __iadd__(self, handler):
+        self._handlers.append(handler)
+        return self
+
+    def __isub__(self, handler):
+        self._handlers.remove(handler)
+        return self
+
+    def fire(self, sender, args):
+        for handler in self._handlers:
+            handler(sender, args)
+
+
+class FakeTrain:
+    """Attribute bag with the Train properties R8Speeder reads."""
+
+    def __init__(self, train_id, symbol, engineer, engineer_type, speed, limit, block, axles,
+                 hp_per_ton=2.5, railroad="BNSF", loco=1000):
+        self.TrainID = train_id
+        self.TrainSymbol = symbol
+        self.EngineerName = engineer
+        self.EngineerType = engineer_type
+        self.TrainSpeedMph = speed
+        self.TrainSpeedLimitMPH = limit
+        self.BlockID = block
+        self.AxleCount = axles
+        self.HpPerTon = hp_per_ton
+        self.RailroadInitials = railroad
+        self.LocoNumber = loco
+
+
+class TrainDataEventArgs:
+    __slots__ = ("Train",)
+
+    def __init__(self, train):
+        self.Train = train
+
+
+class SimulationStateEventArgs:
+    __slots__ = ("SimulationTime",)
+
+    def __init__(self, sim_time):
+        self.SimulationTime = sim_time
+
+
+class DispatcherPermissionEventArgs:
+    __slots__ = ("Permission",)
+
+    def __init__(self, permission):
+        self.Permission = permission
+
+
+# =========================================================
+# FLEET
+# =========================================================
+BEHAVIOURS = ("cruise", "parked", "speeding", "overspeed", "coupling", "relinquish", "zero_limit", "dropout")
+
+
+class FleetSpec:
+    """How many trains of each behaviour the stand-in generates."""
+
+    def __init__(self, players=60, ai=120, speeding=0.1, overspeed=0.03, coupling=0.1,
+                 relinquish=0.05, zero_limit=0.02, dropout=0.03, parked=0.3, ai_churn=0.002, seed=8):
+        self.players = players
+        self.ai = ai
+        self.speeding = speeding
+        self.overspeed = overspeed
+        self.coupling = coupling
+        self.relinquish = relinquish
+        self.zero_limit = zero_limit
+        self.dropout = dropout
+        self.parked = parked
+        self.ai_churn = ai_churn
+        self.seed = seed
+
+
+class _FleetTrain:
+    __slots__ = ("train", "behaviour", "phase", "base_axles", "silent")
+
+    def __init__(self, train, behaviour, phase):
+        self.train = train
+        self.behaviour = behaviour
+        self.phase = phase
+        self.base_axles = train.AxleCount
+        self.silent = False
+
+
+def _pick_behaviour(rng, spec):
+    roll = rng.random()
+    for name in ("speeding", "overspeed", "coupling", "relinquish", "zero_limit", "dropout", "parked"):
+        share = getattr(spec, name)
+        if roll < share:
+            return name
+        roll -= share
+    return "cruise"
+
+
+class Fleet:
+    """Deterministic population of fake trains advanced one sim step at a time."""
+
+    SYMBOLS = ("Q-LACCHI", "M-BARSBD", "Z-LACWSP-991", "H-BARTUL", "U-TRONA", "S-LACSuper", "G-CLOBAR")
+    LIMITS = (25.0, 40.0, 50.0, 60.0, 70.0)
+
+    def __init__(self, spec=None):
+        self.spec = spec or FleetSpec()
+        self.rng = random.Random(self.spec.seed)
+        self.trains = []
+        tid = 1000
+        for i in range(self.spec.players):
+            self.trains.append(self._make(tid, f"Engineer{i:03d}", EEngineerType.Player,
+                                          _pick_behaviour(self.rng, self.spec)))
+            tid += 1
+        for _ in range(self.spec.ai):
+            self.trains.append(self._make(tid, "AI", EEngineerType.AI, "cruise"))
+            tid += 1
+        self.next_id = tid
+
+    def _make(self, tid, engineer, engineer_type, behaviour):
+        rng = self.rng
+        limit = rng.choice(self.LIMITS)
+        block = rng.choice((32012, 32045, 10233, 20417, 40101))
+        speed = 0.0 if behaviour == "parked" else limit - rng.uniform(1.0, 4.0)
+        train = FakeTrain(tid, rng.choice(self.SYMBOLS), engineer, engineer_type, speed, limit,
+                          block, rng.randrange(40, 400, 4), loco=rng.randrange(1000, 9999))
+        return _FleetTrain(train, behaviour, rng.randrange(0, 600))
+
+    def step(self, tick):
+        """Advance every train by one step; `tick` is the integer step counter."""
+        rng = self.rng
+        for ft in self.trains:
+            t = ft.train
+            cycle = (tick + ft.phase) % 600
+            behaviour = ft.behaviour
+            if behaviour == "parked":
+                continue
+            if behaviour == "cruise":
+                if t.EngineerType == EEngineerType.AI and rng.random() < self.spec.ai_churn:
+                    # AI train despawned; a new one takes its slot under a fresh TrainID
+                    t.TrainID = self.next_id
+                    self.next_id += 1
+                t.TrainSpeedMph = t.TrainSpeedLimitMPH - 2.0 + rng.uniform(-1.0, 1.0)
+            elif behaviour == "speeding":
+                over = 10.0 if cycle < 300 else -2.0
+                t.TrainSpeedMph = t.TrainSpeedLimitMPH + over + rng.uniform(-0.5, 0.5)
+            elif behaviour == "overspeed":
+                over = 30.0 if cycle < 120 else -3.0
+                t.TrainSpeedMph = t.TrainSpeedLimitMPH + over + rng.uniform(-0.5, 0.5)
+            elif behaviour == "coupling":
+                if cycle < 100:
+                    t.TrainSpeedMph = max(0.0, 10.0 - cycle * 0.1)
+                elif cycle == 100:
+                    t.AxleCount = ft.base_axles + 8
+                elif cycle == 400:
+                    t.AxleCount = ft.base_axles
+                else:
+                    t.TrainSpeedMph = 0.0
+            elif behaviour == "relinquish":
+                t.EngineerType = EEngineerType.AI if 200 <= cycle < 260 else EEngineerType.Player
+                t.TrainSpeedMph = t.TrainSpeedLimitMPH - 3.0
+            elif behaviour == "zero_limit":
+                t.TrainSpeedLimitMPH = 0.0 if cycle < 150 else 40.0
+                t.TrainSpeedMph = 5.0
+            elif behaviour == "dropout":
+                # Player train that stops reporting for a while, e.g. a client crash
+                ft.silent = 300 <= cycle < 330
+                t.TrainSpeedMph = t.TrainSpeedLimitMPH - 2.0
+
+
+# =========================================================
+# PROXY
+# =========================================================
+class StandInRun8Proxy:
+    """Drop-in replacement for the object returned by Run8ProxyFactory.GetRun8Proxy()."""
+
+    def __init__(self, fleet=None, step_seconds=1.0, start_time=None):
+        self.TrainData = Event()
+        self.SimulationState = Event()
+        self.Connected = Event()
+        self.Disconnected = Event()
+        self.DispatcherPermission = Event()
+        self.fleet = fleet or Fleet()
+        self.step_seconds = step_seconds
+        self.sim_time = SimDateTime(start_time or datetime(2026, 1, 1, 8, 0, 0))
+        self.tick = 0
+        self.radio_log = []
+        self.host = None
+        self.port = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def SendRadioText(self, channel, text):
+        self.radio_log.append((channel, text))
+
+    def step(self):
+        """Emit one SimulationState tick followed by a TrainData event per train."""
+        self.sim_time = self.sim_time.AddSeconds(self.step_seconds)
+        self.SimulationState.fire(self, SimulationStateEventArgs(self.sim_time))
+        self.fleet.step(self.tick)
+        self.tick += 1
+        for ft in self.fleet.trains:
+            if not ft.silent:
+                self.TrainData.fire(self, TrainDataEventArgs(ft.train))
+
+    def Start(self, host, port):
+        """Connect and stream events from a background thread in real time."""
+        self.host, self.port = host, port
+        self.Connected.fire(self, None)
+        self.DispatcherPermission.fire(self, DispatcherPermissionEventArgs("Granted"))
+
+        def runner():
+            while not self._stop.is_set():
+                self.step()
+                self._stop.wait(self.step_seconds)
+
+        self._thread = threading.Thread(target=runner, daemon=True)
+        self._thread.start()
+
+    def Stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.Disconnected.fire(self, None)
+
+
+# =========================================================
+# DISCORD
+# =========================================================
+class FakeRateLimited(Exception):
+    """Looks enough like discord.HTTPException(429) for the dispatcher's retry path."""
+    status = 429
+
+    def __init__(self, retry_after):
+        super().__init__(f"429 Too Many Requests (retry after {retry_after}s)")
+        self.retry_after = retry_after
+
+
+class FakeDiscordChannel:
+    def __init__(self, channel_id, fail_every=0):
+        self.id = channel_id
+        self.sent = []
+        self.fail_every = fail_every
+        self._attempts = 0
+
+    async def send(self, text):
+        self._attempts += 1
+        if self.fail_every and self._attempts % self.fail_every == 0:
+            raise FakeRateLimited(0.01)
+        self.sent.append(text)
+
+
+class FakeDiscordClient:
+    """Local stand-in for discord.Client: channels record what is sent to them."""
+
+    def __init__(self, fail_every=0):
+        self.fail_every = fail_every
+        self.channels = {}
+        self.lookups = 0
+
+    def get_channel(self, channel_id):
+        self.lookups += 1
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeDiscordChannel(channel_id, self.fail_every)
+        return channel
+
+    async def wait_until_ready(self):
+        return None
+
+
+class Run8ProxyFactory:
+    fleet_spec = None
+
+    @classmethod
+    def GetRun8Proxy(cls):
+        return StandInRun8Proxy(Fleet(cls.fleet_spec))
+
+
+class DispatcherProxyFactory:
+    DefaultExternalDispatcherPort = 3000
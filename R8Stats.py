@@ -0,0 +1,401 @@
+"""
+Running statistics for R8Speeder: how long each engineer spends over the
+limit, how far over they go, how hard they couple, and which blocks see the
+most speeding.
+
+Everything is updated incrementally from the speeding and coupling handlers
+and takes constant memory per engineer and per block: Welford running
+moments, P-squared quantile estimators and exponentially decayed counters, so
+"recent" numbers fade with a half-life instead of needing history rescans.
+The number of engineers and blocks tracked is capped, least recently active
+first out.
+
+SpeedHistory is the per-train counterpart: a fixed-size ring of recent
+samples that detectors can ask for the mean, min or max speed over the last
+few seconds.
+"""
+import math
+from array import array
+from collections import OrderedDict, deque
+
+STATS_HALF_LIFE_SECONDS = 3600.0
+STATS_MAX_KEYS = 5000
+QUANTILES = (0.5, 0.9, 0.99)
+SPEED_HISTORY_SAMPLES = 64
+SPEED_WINDOW_SECONDS = 10.0
+
+
+# =========================================================
+# ESTIMATORS
+# =========================================================
+class Moments:
+    """Count, mean, standard deviation, min and max of a stream (Welford)."""
+    __slots__ = ("count", "mean", "_m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    @property
+    def stdev(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def as_dict(self):
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "mean": self.mean, "stdev": self.stdev, "min": self.min, "max": self.max}
+
+
+class P2Quantile:
+    """One quantile of a stream in five markers (Jain & Chlamtac's P-squared algorithm)."""
+    __slots__ = ("p", "heights", "positions", "desired", "increments")
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+        self.increments = (0.0, p / 2, p, (1 + p) / 2, 1.0)
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        desired = self.desired
+        for i in range(5):
+            desired[i] += self.increments[i]
+        for i in (1, 2, 3):
+            d = desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                h = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < h < q[i + 1]:
+                    h = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = h
+                n[i] += d
+
+    def value(self):
+        q = self.heights
+        if not q:
+            return None
+        if len(q) < 5:
+            return q[min(len(q) - 1, int(round(self.p * (len(q) - 1))))]
+        return q[2]
+
+
+class Quantiles:
+    """P-squared estimators for QUANTILES plus running moments."""
+    __slots__ = ("moments", "estimators")
+
+    def __init__(self):
+        self.moments = Moments()
+        self.estimators = tuple(P2Quantile(p) for p in QUANTILES)
+
+    def add(self, x):
+        self.moments.add(x)
+        for estimator in self.estimators:
+            estimator.add(x)
+
+    def as_dict(self):
+        out = self.moments.as_dict()
+        for estimator in self.estimators:
+            out[f"p{estimator.p * 100:g}"] = estimator.value()
+        return out
+
+
+class DecayedCounter:
+    """A total that halves every `half_life` seconds, so it tracks recent activity."""
+    __slots__ = ("value", "stamp")
+
+    def __init__(self):
+        self.value = 0.0
+        self.stamp = None
+
+    def add(self, now, amount=1.0, half_life=STATS_HALF_LIFE_SECONDS):
+        self.value = self.get(now, half_life) + amount
+        self.stamp = now
+
+    def get(self, now, half_life=STATS_HALF_LIFE_SECONDS):
+        if self.stamp is None:
+            return 0.0
+        return self.value * 0.5 ** (max(0.0, now - self.stamp) / half_life)
+
+
+# =========================================================
+# WINDOWS
+# =========================================================
+class SpeedHistory:
+    """The last `capacity` (sim seconds, speed, limit, axles) samples of one train, in preallocated arrays.
+
+    The arrays are used as a ring, so append() is O(1) and memory is fixed
+    however long a player keeps the train. The trailing `window` seconds
+    (as of the newest sample, and at most `capacity` samples) are also kept
+    as a running sum and two monotonic deques, which makes window_mean(),
+    window_min() and window_max() O(1) as well.
+    """
+    __slots__ = ("capacity", "window", "times", "speeds", "limits", "axles", "count", "_start", "_sum", "_max",
+                 "_min")
+
+    def __init__(self, capacity=SPEED_HISTORY_SAMPLES, window=SPEED_WINDOW_SECONDS):
+        self.capacity = capacity
+        self.window = window
+        self.times = array("d", [0.0]) * capacity
+        self.speeds = array("d", [0.0]) * capacity
+        self.limits = array("d", [0.0]) * capacity
+        self.axles = array("i", [0]) * capacity
+        self.count = 0  # samples ever appended; the newest is number count - 1
+        self._start = 0  # number of the oldest sample in the window
+        self._sum = 0.0
+        self._max = deque()  # sample numbers in the window with falling speeds
+        self._min = deque()  # ... and with rising speeds
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        self.count = self._start = 0
+        self._sum = 0.0
+        self._max.clear()
+        self._min.clear()
+
+    def append(self, now, speed, limit, axles):
+        seq = self.count
+        capacity = self.capacity
+        speeds = self.speeds
+
+        # Slide the window past samples that are too old or are about to be overwritten.
+        start = self._start
+        cutoff = now - self.window
+        times = self.times
+        while start < seq and (start <= seq - capacity or times[start % capacity] < cutoff):
+            self._sum -= speeds[start % capacity]
+            start += 1
+        if start == seq:
+            self._sum = 0.0  # empty window: drop accumulated rounding error
+        self._start = start
+        high, low = self._max, self._min
+        while high and high[0] < start:
+            high.popleft()
+        while low and low[0] < start:
+            low.popleft()
+
+        i = seq % capacity
+        times[i] = now
+        speeds[i] = speed
+        self.limits[i] = limit
+        self.axles[i] = axles
+        self.count = seq + 1
+        self._sum += speed
+        while high and speeds[high[-1] % capacity] <= speed:
+            high.pop()
+        high.append(seq)
+        while low and speeds[low[-1] % capacity] >= speed:
+            low.pop()
+        low.append(seq)
+
+    def sample(self, back=0):
+        """(sim seconds, speed, limit, axles) of the newest sample, or `back` samples before it; None if gone."""
+        if back >= self.count or back >= self.capacity:
+            return None
+        i = (self.count - 1 - back) % self.capacity
+        return self.times[i], self.speeds[i], self.limits[i], self.axles[i]
+
+    def window_count(self):
+        return self.count - self._start
+
+    def window_mean(self):
+        n = self.count - self._start
+        return self._sum / n if n else None
+
+    def window_max(self):
+        return self.speeds[self._max[0] % self.capacity] if self._max else None
+
+    def window_min(self):
+        return self.speeds[self._min[0] % self.capacity] if self._min else None
+
+    def window_rate(self):
+        """Change in speed per second from the oldest to the newest sample in the window (negative when
+        slowing down), or None with fewer than two samples."""
+        if self.count - self._start < 2:
+            return None
+        first, last = self._start % self.capacity, (self.count - 1) % self.capacity
+        elapsed = self.times[last] - self.times[first]
+        return (self.speeds[last] - self.speeds[first]) / elapsed if elapsed > 0 else None
+
+
+# =========================================================
+# AGGREGATES
+# =========================================================
+class KeyStats:
+    """Everything kept for one engineer or one block."""
+    __slots__ = ("speeding", "seconds_over", "overspeed_bans", "hard_couples", "episodes", "max_over", "couples",
+                 "seconds_over_total")
+
+    def __init__(self):
+        self.speeding = DecayedCounter()
+        self.seconds_over = DecayedCounter()
+        self.overspeed_bans = DecayedCounter()
+        self.hard_couples = DecayedCounter()
+        self.episodes = 0
+        self.seconds_over_total = 0.0
+        self.max_over = Moments()
+        self.couples = Moments()
+
+    def as_dict(self, now):
+        return {
+            "speeding_recent": self.speeding.get(now),
+            "seconds_over_recent": self.seconds_over.get(now),
+            "seconds_over_total": self.seconds_over_total,
+            "episodes": self.episodes,
+            "overspeed_bans_recent": self.overspeed_bans.get(now),
+            "hard_couples_recent": self.hard_couples.get(now),
+            "max_over": self.max_over.as_dict(),
+            "coupling_speed": self.couples.as_dict(),
+        }
+
+
+class KeyTable:
+    """KeyStats by key, capped at `max_keys` with the least recently updated dropped first."""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._stats = OrderedDict()
+
+    def __len__(self):
+        return len(self._stats)
+
+    def get(self, key):
+        return self._stats.get(key)
+
+    def touch(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = KeyStats()
+            if len(self._stats) > self.max_keys:
+                self._stats.popitem(last=False)
+        else:
+            self._stats.move_to_end(key)
+        return stats
+
+    def top(self, n, now, metric):
+        ranked = sorted(((metric(stats, now), key) for key, stats in self._stats.items()), reverse=True)
+        return [(key, value) for value, key in ranked[:n] if value > 0.0]
+
+
+class SpeedStats:
+    """Per-engineer, per-block and overall speeding and coupling statistics.
+
+    Times are sim seconds. Not thread safe; R8Speeder keeps one per server and
+    updates and reads it under that server's lock.
+    """
+
+    def __init__(self, max_keys=STATS_MAX_KEYS):
+        self.engineers = KeyTable(max_keys)
+        self.blocks = KeyTable(max_keys)
+        self.max_over = Quantiles()
+        self.durations = Quantiles()
+        self.coupling_speeds = Quantiles()
+
+    def speeding_started(self, engineer, block, now):
+        for stats in (self.engineers.touch(engineer), self.blocks.touch(block)):
+            stats.speeding.add(now)
+
+    def speeding_ended(self, engineer, block, now, seconds, max_over):
+        self.max_over.add(max_over)
+        self.durations.add(seconds)
+        for stats in (self.engineers.touch(engineer), self.blocks.touch(block)):
+            stats.episodes += 1
+            stats.seconds_over.add(now, seconds)
+            stats.seconds_over_total += seconds
+            stats.max_over.add(max_over)
+
+    def overspeed_ban(self, engineer, block, now):
+        for stats in (self.engineers.touch(engineer), self.blocks.touch(block)):
+            stats.overspeed_bans.add(now)
+
+    def coupled(self, engineer, block, now, speed, hard):
+        self.coupling_speeds.add(speed)
+        for stats in (self.engineers.touch(engineer), self.blocks.touch(block)):
+            stats.couples.add(speed)
+            if hard:
+                stats.hard_couples.add(now)
+
+    def engineer(self, name, now):
+        stats = self.engineers.get(name)
+        return stats.as_dict(now) if stats is not None else None
+
+    def block(self, block_id, now):
+        stats = self.blocks.get(block_id)
+        return stats.as_dict(now) if stats is not None else None
+
+    def top_engineers(self, n, now):
+        """Engineers with the most recent time over the limit, as (name, seconds)."""
+        return self.engineers.top(n, now, lambda stats, t: stats.seconds_over.get(t))
+
+    def hot_blocks(self, n, now):
+        """Blocks with the most recent speeding starts, as (BlockID, decayed count)."""
+        return self.blocks.top(n, now, lambda stats, t: stats.speeding.get(t))
+
+    def summary(self, now, n=5):
+        return {
+            "engineers_tracked": len(self.engineers),
+            "blocks_tracked": len(self.blocks),
+            "max_over": self.max_over.as_dict(),
+            "speeding_seconds": self.durations.as_dict(),
+            "coupling_speed": self.coupling_speeds.as_dict(),
+            "top_engineers": self.top_engineers(n, now),
+            "hot_blocks": self.hot_blocks(n, now),
+        }
+
+    def digest(self, now, n=5):
+        """Short text summary for the status channel, or None if nothing has happened yet."""
+        if not self.max_over.moments.count and not self.coupling_speeds.moments.count \
+                and not self.top_engineers(1, now) and not self.hot_blocks(1, now):
+            return None
+
+        def spread(quantiles):
+            values = quantiles.as_dict()
+            if not values["count"]:
+                return "none"
+            return f"{values['count']}, median {values['p50']:.1f}, p90 {values['p90']:.1f}, max {values['max']:.1f}"
+
+        lines = [f"Speeding digest (recent = last ~{STATS_HALF_LIFE_SECONDS / 3600:g}h, decaying):"]
+        top = self.top_engineers(n, now)
+        if top:
+            lines.append("Most time over limit: " + ", ".join(f"{name} {seconds / 60:.1f} min" for name, seconds in top))
+        hot = self.hot_blocks(n, now)
+        if hot:
+            lines.append("Speeding hot spots: " + ", ".join(f"block {block} ({count:.1f})" for block, count in hot))
+        lines.append(f"Peak MPH over limit per episode: {spread(self.max_over)}")
+        lines.append(f"Coupling speeds MPH: {spread(self.coupling_speeds)}")
+        return "\n".join(lines)
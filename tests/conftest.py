@@ -0,0 +1,40 @@
+import json
+import os
+import sys
+import types
+
+import pytest
+
+# The R8 modules live at the repository root, next to SpeederSettings.json.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def isolate(monkeypatch):
+    """Have `monkeypatch` put back every R8Speeder module global (settings, servers, pipeline stages) when
+    it is undone, whatever the test sets them to in between."""
+    import R8Speeder as r8
+    for name, value in list(vars(r8).items()):
+        if not name.startswith("__") and not callable(value) and not isinstance(value, types.ModuleType):
+            monkeypatch.setattr(r8, name, value)
+
+
+@pytest.fixture(autouse=True)
+def speeder_globals(monkeypatch):
+    isolate(monkeypatch)
+
+
+def use_settings(tmp_path, monkeypatch, overrides):
+    """Load the repository's SpeederSettings.json with `overrides` laid over it into R8Speeder."""
+    import R8Speeder as r8
+    import R8StandIn
+
+    with open(os.path.join(ROOT, "SpeederSettings.json"), encoding="utf-8") as f:
+        data = json.load(f)
+    data.update(overrides)
+    settings = tmp_path / "settings.json"
+    settings.write_text(json.dumps(data), encoding="utf-8")
+    monkeypatch.setattr(r8, "SETTINGS_FILE", str(settings))
+    monkeypatch.setattr(r8, "EEngineerType", R8StandIn.EEngineerType)
+    r8.load_settings()
+    return r8.servers[0]
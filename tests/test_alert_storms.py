@@ -0,0 +1,48 @@
+"""
+AlertCorrelator: storms open on enough trains alerting in one block, and
+close (and forget the block) once it goes quiet, even if nothing else arrives.
+"""
+import R8Speeder as r8
+import R8StandIn
+
+from conftest import use_settings
+
+SETTINGS = {"AlertStormTrains": 3, "AlertStormWindow": 60, "DiscordEnabled": True, "DiscordAlertChannel": 2,
+            "DiscordStatusChannel": 1}
+
+
+def snapshot(train_id, block):
+    train = R8StandIn.FakeTrain(train_id, "Q-LACCHI", f"Engineer{train_id}", R8StandIn.EEngineerType.Player, 50.0,
+                                40.0, block, 120)
+    return r8.TrainSnapshot(train, train_id, int(R8StandIn.EEngineerType.Player))
+
+
+def test_quiet_storm_ends_from_the_idle_path(tmp_path, monkeypatch, capsys):
+    server = use_settings(tmp_path, monkeypatch, SETTINGS)
+    monkeypatch.setattr(r8, "discord_send", lambda channel_id, msg: None)
+    storms = server.alert_storms
+    assert [storms.admit(snapshot(1000 + i, 32045), 1000 + i, 10.0 + i) for i in range(3)] == [True, True, False]
+    assert storms.admit(snapshot(2000, 10233), 2000, 12.0)
+    assert storms.stats()["active"] == 1
+
+    # No more TrainData: only the detection worker's idle polls keep running.
+    r8.run_deadlines(server, 60.0)
+    assert storms.stats()["active"] == 1
+    r8.run_deadlines(server, 80.0)
+    assert storms.stats()["active"] == 0
+    assert "Block 32045 has calmed down" in capsys.readouterr().out
+    # Block 10233's lone alert ages out too; blocks are swept once a window.
+    r8.run_deadlines(server, 130.0)
+    assert storms.stats()["blocks"] == 0
+
+
+def test_sustained_ban_does_not_feed_storms_without_discord(tmp_path, monkeypatch):
+    server = use_settings(tmp_path, monkeypatch, {**SETTINGS, "DiscordEnabled": False})
+    for i in range(3):
+        state = r8.TrainState(1000 + i, int(R8StandIn.EEngineerType.Player))
+        state.last_snap = snapshot(1000 + i, 32045)
+        state.speeding_start = state.speed_exceed_start = 0.0
+        r8.check_sustained_speeding(server, state, server.alert_speed_timer + 1.0 + i)
+        assert state.sustained_warned
+    assert server.alert_storms.stats() == {"admitted": 0, "held": 0, "storms": 0, "blocks": 0, "active": 0,
+                                           "pings_throttled": 0}
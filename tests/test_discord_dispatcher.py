@@ -0,0 +1,84 @@
+"""
+DiscordDispatcher against R8StandIn's FakeDiscordClient: packing, the token
+bucket and the 429 retry path, on a private event loop.
+"""
+import asyncio
+import time
+
+import pytest
+
+import R8Speeder as r8
+import R8StandIn
+
+CHANNEL = 7
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def send_all(loop, dispatcher, messages):
+    """Submit `messages` to CHANNEL and run the loop until the dispatcher has nothing left to send."""
+    async def settle():
+        await asyncio.sleep(0)
+        while dispatcher.backlog() or dispatcher._draining:
+            await asyncio.sleep(0.001)
+
+    for msg in messages:
+        dispatcher.submit(CHANNEL, msg)
+    loop.run_until_complete(settle())
+    return dispatcher.client.channels[CHANNEL].sent
+
+
+def test_backlog_is_packed_into_few_messages(loop):
+    dispatcher = r8.DiscordDispatcher(R8StandIn.FakeDiscordClient(), loop)
+    lines = [f"[08:00:{i:02d}] Engineer{i:03d} began speeding" for i in range(10)]
+    sent = send_all(loop, dispatcher, lines)
+    assert sent == ["\n".join(lines)]
+    assert dispatcher.stats() == {"queued": 10, "sent": 1, "batched": 10, "retried": 0, "failed": 0, "held": 0,
+                                  "dropped": 0, "backlog": 0}
+
+
+def test_packing_stops_at_the_message_limit(loop):
+    dispatcher = r8.DiscordDispatcher(R8StandIn.FakeDiscordClient(), loop)
+    half = r8.DISCORD_MAX_CHARS // 2 - 100
+    lines = ["a" * half, "b" * half, "c" * half, "d" * (r8.DISCORD_MAX_CHARS + 50)]
+    sent = send_all(loop, dispatcher, lines)
+    assert sent == [lines[0] + "\n" + lines[1], lines[2], lines[3][:r8.DISCORD_MAX_CHARS]]
+    assert dispatcher.sent == 3
+    assert dispatcher.batched == 2
+
+
+def test_token_bucket_spaces_out_sends(loop):
+    dispatcher = r8.DiscordDispatcher(R8StandIn.FakeDiscordClient(), loop, rate=2, per=0.2)
+    # Too long to pack in pairs, so each line needs a token: two at once, then one every 0.1s.
+    lines = [str(i) * (r8.DISCORD_MAX_CHARS // 2 + 1) for i in range(5)]
+    start = time.monotonic()
+    sent = send_all(loop, dispatcher, lines)
+    assert time.monotonic() - start >= 0.25
+    assert sent == lines
+    assert dispatcher.sent == 5
+    assert dispatcher.batched == 0
+
+
+def test_rate_limited_sends_are_retried(loop):
+    dispatcher = r8.DiscordDispatcher(R8StandIn.FakeDiscordClient(fail_every=2), loop)
+    lines = [str(i) * (r8.DISCORD_MAX_CHARS // 2 + 1) for i in range(3)]
+    sent = send_all(loop, dispatcher, lines)
+    assert sent == lines
+    assert dispatcher.retried == 2
+    assert dispatcher.failed == 0
+    assert dispatcher.client.lookups == 1
+
+
+def test_gives_up_after_max_retries(loop, capsys):
+    dispatcher = r8.DiscordDispatcher(R8StandIn.FakeDiscordClient(fail_every=1), loop)
+    sent = send_all(loop, dispatcher, ["lost"])
+    assert sent == []
+    assert dispatcher.retried == r8.DISCORD_MAX_RETRIES
+    assert dispatcher.failed == 1
+    assert dispatcher.sent == 0
+    assert f"Giving up on message to channel {CHANNEL}" in capsys.readouterr().out
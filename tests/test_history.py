@@ -0,0 +1,35 @@
+"""
+R8History: what the write-behind store commits and what the queries count.
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import R8History
+
+
+def snap(engineer, speed):
+    return SimpleNamespace(EngineerName=engineer, TrainSymbol="Q-LACCHI", BlockID=32045, TrainSpeedMph=speed,
+                           TrainSpeedLimitMPH=25.0)
+
+
+def test_only_hard_couplings_are_violations(tmp_path):
+    store = R8History.HistoryStore(str(tmp_path / "speeder.db"))
+    threading.Thread(target=store.run, daemon=True).start()
+    for i in range(5):
+        store.add("coupled", "08:00:00", snap("Switcher", 1.5), 1000 + i, amount=1.5)
+    store.add("hard_coupled", "08:01:00", snap("Rammer", 9.0), 2000, amount=9.0)
+    store.add("speeding_start", "08:02:00", snap("Rammer", 40.0), 2000)
+    assert store.flush(5.0)
+
+    conn = R8History.connect(store.path)
+    since = time.time() - 60
+    assert R8History.top_offenders(conn, since) == [("Rammer", 2, 1, 0, 0, 1)]
+    assert len(R8History.couples(conn, since)) == 6
+    assert [row[3] for row in R8History.couples(conn, since, block=32045, min_speed=7)] == ["hard_coupled"]
+
+
+def test_flush_gives_up_after_timeout(tmp_path):
+    store = R8History.HistoryStore(str(tmp_path / "speeder.db"))
+    store.add("timeout", "08:00:00", None, 1000)
+    assert not store.flush(0.05)
@@ -0,0 +1,61 @@
+import threading
+
+import R8Speeder as r8
+
+
+class BrokenConsole:
+    """A console that cannot encode what it is given, like a cp1252 Windows console."""
+
+    def write(self, text):
+        raise UnicodeEncodeError("charmap", text, 0, 1, "character maps to <undefined>")
+
+    def flush(self):
+        pass
+
+
+def test_console_failure_still_reaches_log_file(tmp_path, monkeypatch):
+    path = tmp_path / "Speeder.log"
+    sink = r8.LogSink(100, str(path))
+    threading.Thread(target=sink.run, daemon=True).start()
+    monkeypatch.setattr("sys.stdout", BrokenConsole())
+
+    sink.write("[Speeder] Ænders took control of U-TRONA")
+    sink.write("[Speeder] second line")
+    sink.flush()
+
+    text = path.read_text(encoding="utf-8")
+    assert "Ænders took control of U-TRONA" in text
+    assert "second line" in text
+
+
+def test_exit_flush_writes_what_is_queued(tmp_path, monkeypatch):
+    path = tmp_path / "Speeder.log"
+    sink = r8.LogSink(100, str(path))
+    monkeypatch.setattr(r8, "log_sink", sink)
+    r8.emit("[01/01/2026 08:00:00 AM] Engineer000 needs to be banned")
+    # The writer is not running yet: the flush gives up after the timeout instead of hanging.
+    r8.flush_on_exit(0.05)
+    assert not path.exists()
+
+    threading.Thread(target=sink.run, daemon=True).start()
+    r8.emit("\nExiting...")
+    r8.flush_on_exit(1.0)
+    text = path.read_text(encoding="utf-8")
+    assert 0 < text.index("Engineer000 needs to be banned") < text.index("Exiting...")
+
+
+class FakeProfiler:
+    def write(self, path):
+        return path + ".folded", path + ".txt"
+
+
+def test_profile_message_goes_through_the_log(tmp_path, monkeypatch):
+    path = tmp_path / "Speeder.log"
+    sink = r8.LogSink(100, str(path))
+    threading.Thread(target=sink.run, daemon=True).start()
+    monkeypatch.setattr(r8, "log_sink", sink)
+    monkeypatch.setattr(r8, "profiler", FakeProfiler())
+    monkeypatch.setattr(r8, "profile_file", "Speeder.profile")
+    r8.write_profile()
+    # No flush here: write_profile has already waited for the message to be written.
+    assert "Profile written to Speeder.profile.folded" in path.read_text(encoding="utf-8")
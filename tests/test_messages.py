@@ -0,0 +1,39 @@
+"""
+Message templates as settings files use them: what loads, and what is sent
+when a message is left out.
+"""
+import json
+import os
+
+import R8Speeder as r8
+import R8StandIn
+
+from conftest import ROOT, use_settings
+
+
+def settings_messages(**changes):
+    with open(os.path.join(ROOT, "SpeederSettings.json"), encoding="utf-8") as f:
+        messages = json.load(f)["Messages"]
+    messages.update(changes)
+    return {key: text for key, text in messages.items() if text is not None}
+
+
+def snapshot(engineer):
+    train = R8StandIn.FakeTrain(1000, "Q-LACCHI", engineer, R8StandIn.EEngineerType.Player, 5.0, 0.0, 32012, 120)
+    return r8.TrainSnapshot(train, 1000, int(R8StandIn.EEngineerType.Player))
+
+
+def test_automated_notice_may_name_the_train(tmp_path, monkeypatch):
+    text = "Automated message for {train.EngineerName}:"
+    use_settings(tmp_path, monkeypatch, {"Messages": settings_messages(AutomatedNoticeMsg=text)})
+    assert r8.automated_notice(snapshot("Engineer007")) == "Automated message for Engineer007:"
+    # The periodic announcement is about no train in particular.
+    assert r8.automated_notice() == text
+
+
+def test_missing_messages(tmp_path, monkeypatch):
+    use_settings(tmp_path, monkeypatch,
+                 {"Messages": settings_messages(ConnectedMsg=None, AutomatedNoticeMsg=None, ZeroLimitMsg="")})
+    assert r8.format_msg("ConnectedMsg", stamp="08:00:00") == "*ERROR: SpeederSettings.json key is not in messages*"
+    assert r8.automated_notice(snapshot("Engineer007")) is None
+    assert r8.format_msg("ZeroLimitMsg", train=snapshot("Engineer007")) is None
@@ -0,0 +1,32 @@
+"""
+Metrics set up from the settings: each server's lock is timed from the moment
+the Server is built, before any worker can take it.
+"""
+import R8Metrics
+import R8Speeder as r8
+
+from conftest import use_settings
+
+
+def test_server_locks_are_timed_when_built(tmp_path, monkeypatch):
+    for name in r8.METRICS_CALLS:
+        monkeypatch.setattr(r8, name, getattr(r8, name))
+    use_settings(tmp_path, monkeypatch, {"MetricsPort": 0, "MetricsSummaryTimer": 60,
+                                         "Servers": [{"Name": "East"}, {"Name": "West"}]})
+    locks = [server.lock for server in r8.servers]
+    assert all(isinstance(lock, R8Metrics.TimedLock) for lock in locks)
+
+    r8.start_metrics()
+    assert [server.lock for server in r8.servers] == locks
+    with r8.servers[0].lock:
+        pass
+    assert r8.metrics.lock_hold["East"].count == 1
+    assert "West" in r8.metrics.lock_wait
+
+
+def test_metrics_off_uses_plain_locks(tmp_path, monkeypatch):
+    use_settings(tmp_path, monkeypatch, {"MetricsPort": 0, "MetricsSummaryTimer": 0})
+    assert r8.metrics is None
+    assert not isinstance(r8.servers[0].lock, R8Metrics.TimedLock)
+    r8.start_metrics()
+    assert r8.metrics is None
@@ -0,0 +1,61 @@
+"""
+Replay checks: drive R8Speeder's handlers from the stand-in proxy and compare
+everything the bot says (console, Discord, radio) between two runs.
+"""
+import contextlib
+import io
+
+import R8Speeder as r8
+import R8StandIn
+
+from conftest import isolate, use_settings
+
+# Tight thresholds so a short replay raises every kind of alert.
+OVERRIDES = {"AlertSpeed": 2, "OverSpeed": 8, "AlertSpeedTimer": 40, "HardCoupleSpeed": 0, "VerboseLogging": True,
+             "DiscordEnabled": True, "DiscordStatusChannel": 1, "DiscordAlertChannel": 2, "DiscordAlertRole": 3}
+
+
+def replay(tmp_path, monkeypatch, steps=900, players=40, ai=20, seed=5):
+    """Console lines, Discord sends and radio requests for one replay, and how many updates were skipped.
+
+    The handlers run inline on the calling thread, as they do without the
+    pipeline, and every global the replay sets is put back with `monkeypatch`.
+    """
+    isolate(monkeypatch)
+    # Discord and radio are recorded where the detectors hand them off: the Discord dispatcher and the
+    # radio thread pace and merge on wall-clock time, which would make two runs differ for no reason.
+    discord, radio = [], []
+    monkeypatch.setattr(r8, "discord_send", lambda channel_id, msg: discord.append((channel_id, msg)))
+    monkeypatch.setattr(r8, "radio_notice", lambda server, body, dedupe=True: radio.append(body))
+    monkeypatch.setattr(r8, "radio_zero_limit", lambda server, snap: radio.append(("zero limit", snap.EngineerName)))
+
+    server = use_settings(tmp_path, monkeypatch, OVERRIDES)
+    fleet = R8StandIn.Fleet(R8StandIn.FleetSpec(players=players, ai=ai, zero_limit=0.1, seed=seed))
+    proxy = R8StandIn.StandInRun8Proxy(fleet)
+    r8.attach(server, proxy)
+    console = io.StringIO()
+    with contextlib.redirect_stdout(console):
+        for _ in range(steps):
+            proxy.step()
+    return console.getvalue().splitlines(), discord, radio, server.updates_unchanged
+
+
+def test_unchanged_skip_does_not_change_output(tmp_path, monkeypatch):
+    with monkeypatch.context() as patch:
+        skipped = replay(tmp_path, patch)
+    with monkeypatch.context() as patch:
+        # A fingerprint that never matches turns the unchanged-update fast path off.
+        patch.setattr(r8, "snapshot_fingerprint", lambda snap: object())
+        full = replay(tmp_path, patch)
+
+    console, discord, radio, unchanged = skipped
+    assert unchanged > 0
+    assert full[3] == 0
+    for kind in ("began speeding", "no longer speeding", "needs to be banned", "has been speeding", "coupled at",
+                 "took control"):
+        assert any(kind in line for line in console), kind
+    assert discord and radio
+
+    assert console == full[0]
+    assert discord == full[1]
+    assert radio == full[2]
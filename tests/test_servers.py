@@ -0,0 +1,65 @@
+"""
+Two Servers entries driven from two stand-in fleets: each server keeps its
+own thresholds, train state, message prefix, Discord channels and radio.
+Both fleets number their trains from the same TrainID, as two Run8 servers do.
+"""
+import contextlib
+import io
+
+import R8Speeder as r8
+import R8StandIn
+
+from conftest import use_settings
+
+SERVERS = [
+    {"Name": "East", "Host": "10.0.0.5", "Port": 3000, "AlertSpeed": 2, "DiscordStatusChannel": 11},
+    {"Name": "West", "Host": "10.0.0.6", "Port": 3000, "AlertSpeed": 100, "OverSpeed": 200,
+     "DiscordStatusChannel": 22},
+]
+
+
+def test_servers_stay_separate(tmp_path, monkeypatch):
+    discord = []
+    monkeypatch.setattr(r8, "discord_send", lambda channel_id, msg: discord.append((channel_id, msg)))
+    use_settings(tmp_path, monkeypatch, {"Servers": SERVERS, "DiscordEnabled": True, "DiscordAlertChannel": 0,
+                                         "VerboseLogging": True, "PeriodicAnnounceTimer": 0})
+    east, west = r8.servers
+    fleets = {
+        east: R8StandIn.Fleet(R8StandIn.FleetSpec(players=30, ai=10, speeding=0.3, zero_limit=0.3, seed=1)),
+        west: R8StandIn.Fleet(R8StandIn.FleetSpec(players=8, ai=10, speeding=0.5, zero_limit=0.0, seed=2)),
+    }
+    proxies = {}
+    for server, fleet in fleets.items():
+        proxies[server] = R8StandIn.StandInRun8Proxy(fleet)
+        r8.attach(server, proxies[server])
+    console = io.StringIO()
+    with contextlib.redirect_stdout(console):
+        for _ in range(300):
+            for proxy in proxies.values():
+                proxy.step()
+    lines = console.getvalue().splitlines()
+
+    assert (east.prefix, west.prefix) == ("[East] ", "[West] ")
+    took_control = [line for line in lines if "took control" in line]
+    assert {line.split(" ", 1)[0] for line in took_control} == {"[East]", "[West]"}
+    # Only East's AlertSpeed is low enough to alert.
+    speeding = [line for line in lines if "began speeding" in line]
+    assert speeding and all(line.startswith("[East] ") for line in speeding)
+    assert {channel for channel, msg in discord if msg.startswith("[East] ")} == {11}
+    assert {channel for channel, msg in discord if msg.startswith("[West] ")} == {22}
+
+    # The same TrainIDs on both servers are different trains.
+    compared = 0
+    for server, fleet in fleets.items():
+        for ft in fleet.trains:
+            state = server.trains.get(ft.train.TrainID)
+            if state is not None and state.last_snap is not None:
+                assert state.last_snap.TrainSymbol == ft.train.TrainSymbol
+                assert state.last_snap.TrainSpeedLimitMPH == ft.train.TrainSpeedLimitMPH
+                compared += 1
+    assert compared > 20
+    assert east.updates_processed > west.updates_processed > 0
+
+    # 0 MPH limit notices go out on the radio of the server the train is on.
+    assert any("0 MPH speed limit" in text for _, text in proxies[east].radio_log)
+    assert not any("0 MPH speed limit" in text for _, text in proxies[west].radio_log)
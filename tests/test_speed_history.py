@@ -0,0 +1,54 @@
+"""
+SpeedHistory as the coupling detector sees it: one train driven through
+R8Speeder's TrainData handler a sim second at a time.
+"""
+import pytest
+
+import R8Speeder as r8
+import R8StandIn
+
+from conftest import use_settings
+
+
+def drive(tmp_path, monkeypatch, speeds):
+    """Feed one player train `speeds` (MPH per sim second, "couple" adds 8 axles) and return the CoupledMsg values."""
+    coupled = []
+    format_msg = r8.format_msg
+
+    def record(key, **kwargs):
+        if key == "CoupledMsg":
+            coupled.append(kwargs)
+        return format_msg(key, **kwargs)
+
+    monkeypatch.setattr(r8, "format_msg", record)
+    server = use_settings(tmp_path, monkeypatch, {"DiscordEnabled": False, "LogFile": "", "HistoryFile": ""})
+    proxy = R8StandIn.StandInRun8Proxy(R8StandIn.Fleet(R8StandIn.FleetSpec(players=0, ai=0)))
+    r8.attach(server, proxy)
+    train = R8StandIn.FakeTrain(1000, "Q-LACCHI", "Engineer000", R8StandIn.EEngineerType.Player, 0.0, 40.0,
+                                32012, 120)
+    for speed in speeds:
+        if speed == "couple":
+            train.AxleCount += 8
+        else:
+            train.TrainSpeedMph = speed
+        proxy.step()
+        proxy.TrainData.fire(proxy, R8StandIn.TrainDataEventArgs(train))
+    return server, server.trains.get(1000), coupled
+
+
+def test_steady_updates_stay_in_the_window(tmp_path, monkeypatch):
+    server, state, _ = drive(tmp_path, monkeypatch, [6.0] * 30)
+    assert server.updates_unchanged == 29
+    assert state.history.window_count() == 11
+    assert state.history.window_mean() == 6.0
+    assert state.history.window_rate() == 0.0
+
+
+def test_steady_approach_to_coupling(tmp_path, monkeypatch):
+    # 6 MPH for 20 seconds, slowing to 1 MPH over five, then coupling without changing speed.
+    _, _, coupled = drive(tmp_path, monkeypatch, [6.0] * 21 + [5.0, 4.0, 3.0, 2.0, 1.0, "couple"])
+    assert len(coupled) == 1
+    assert coupled[0]["speed"] == 1.0
+    assert coupled[0]["approach_max"] == 6.0
+    # Over the ten seconds before the coupling: 6 MPH down to 1 MPH.
+    assert coupled[0]["approach_decel"] == pytest.approx(0.5)